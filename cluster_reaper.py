@@ -0,0 +1,166 @@
+"""
+Deferred teardown of test clusters.
+
+Stopping the JVMs and deleting a cluster directory used to happen on the
+critical path between two tests. The reaper does it on a background thread
+instead, while the journal keeps track of every cluster that has not been
+reclaimed yet, so the leftovers of an interrupted run can be cleaned up by
+the next one.
+"""
+import atexit
+import os
+import Queue
+import threading
+
+from collections import OrderedDict
+
+
+class ClusterJournal(object):
+    """
+    Append-only record of the clusters created by one worker and of those
+    that have since been reclaimed. Every line is '<state>\\t<path>\\t<name>'
+    and is fsync'd, so it survives the harness being killed. The file is
+    truncated whenever nothing is left to reclaim.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def created(self, test_path, name):
+        self._append('created', test_path, name)
+
+    def reaped(self, test_path, name):
+        self._append('reaped', test_path, name)
+        with self.lock:
+            if not self._pending():
+                open(self.path, 'w').close()
+
+    def pending(self):
+        """Returns (path, name) for every cluster not reclaimed yet, oldest first"""
+        with self.lock:
+            return self._pending()
+
+    def _pending(self):
+        entries = OrderedDict()
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != 3:
+                    # torn write from a crash
+                    continue
+                state, test_path, name = fields
+                if state == 'created':
+                    entries.pop(test_path, None)
+                    entries[test_path] = name
+                else:
+                    entries.pop(test_path, None)
+        return entries.items()
+
+    def _append(self, state, test_path, name):
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write('%s\t%s\t%s\n' % (state, test_path, name))
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class _ReapJob(object):
+
+    def __init__(self, cluster, test_path, remove, gently, after):
+        self.cluster = cluster
+        self.test_path = test_path
+        self.remove = remove
+        self.gently = gently
+        self.after = after
+        # set once the nodes are stopped and their addresses and ports are free
+        self.released = threading.Event()
+
+
+class ClusterReaper(object):
+    """
+    Stops and removes clusters on a background thread.
+
+    Callers that are about to bind cluster addresses must call
+    wait_until_released first, which only waits for the JVMs of queued
+    clusters to be gone, not for their directories to be deleted.
+    """
+
+    def __init__(self, journal, log=None):
+        self.journal = journal
+        self.log = log
+        self.queue = Queue.Queue()
+        self.jobs = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def reap(self, cluster, test_path, remove=True, gently=False, sync=False, after=None):
+        """
+        Stops cluster and, if remove is set, deletes test_path. after, if
+        given, is then called with test_path, whether or not the cluster was
+        removed and even if stopping or removing it failed. Unless sync is
+        set this happens on the reaper thread.
+        """
+        job = _ReapJob(cluster, test_path, remove, gently, after)
+        if sync:
+            self._process(job)
+            return
+        with self.lock:
+            self.jobs.append(job)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+                atexit.register(self.flush)
+        self.queue.put(job)
+
+    def in_flight(self):
+        """Returns the paths of the clusters queued or being reclaimed"""
+        with self.lock:
+            return set(job.test_path for job in self.jobs)
+
+    def wait_until_released(self, timeout=120):
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            if not job.released.wait(timeout):
+                raise RuntimeError("cluster at %s was not stopped within %ss" % (job.test_path, timeout))
+
+    def flush(self):
+        """Blocks until every queued cluster has been reclaimed"""
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self._process(job)
+            finally:
+                with self.lock:
+                    self.jobs.remove(job)
+                self.queue.task_done()
+
+    def _process(self, job):
+        cluster = job.cluster
+        try:
+            try:
+                cluster.stop(gently=job.gently)
+            finally:
+                job.released.set()
+            if job.remove:
+                if self.log:
+                    self.log("removing ccm cluster " + cluster.name + " at: " + job.test_path)
+                cluster.remove()
+                os.rmdir(job.test_path)
+        except Exception as e:
+            print "Error reclaiming cluster at %s: %s" % (job.test_path, e)
+        else:
+            self.journal.reaped(job.test_path, cluster.name)
+        finally:
+            if job.after is not None:
+                try:
+                    job.after(job.test_path)
+                except Exception as e:
+                    print "Error releasing cluster at %s: %s" % (job.test_path, e)
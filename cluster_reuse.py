@@ -0,0 +1,54 @@
+"""
+Bookkeeping of the clusters that tests of a @canReuseCluster class hand over
+to each other.
+
+A running cluster is only reused by a test that asks for the same
+requirements (node count, partitioner, configuration options, cassandra
+version) as the test that started it, and only once the keyspaces created
+since then have been dropped. Tests run in nose's order, so each change of
+requirements between consecutive tests costs a fresh cluster; the summary
+logged at exit tells how many starts were saved.
+"""
+import atexit
+
+
+class ReuseScheduler(object):
+
+    def __init__(self, log=None):
+        self.log = log
+        # test path -> (requirements key, keyspaces right after the start)
+        self.clusters = {}
+        self.starts = 0
+        self.reuses = 0
+        self.replacements = 0
+        self.summary_registered = False
+
+    def lookup(self, test_path):
+        """Returns (key, keyspaces) for the cluster at test_path, or None"""
+        return self.clusters.get(test_path)
+
+    def started(self, test_path, key, keyspaces):
+        self.clusters[test_path] = (key, frozenset(keyspaces))
+        self.starts += 1
+        self._register_summary()
+
+    def reused(self):
+        self.reuses += 1
+        self._register_summary()
+
+    def replaced(self):
+        """Counts a running cluster thrown away because it did not fit the next test"""
+        self.replacements += 1
+
+    def forget(self, test_path):
+        self.clusters.pop(test_path, None)
+
+    def summary(self):
+        if self.log:
+            self.log("Cluster reuse: %d tests, %d cluster starts, %d starts saved, %d clusters replaced" % (
+                self.starts + self.reuses, self.starts, self.reuses, self.replacements))
+
+    def _register_summary(self):
+        if not self.summary_registered:
+            atexit.register(self.summary)
+            self.summary_registered = True
@@ -0,0 +1,149 @@
+"""
+Pool of pre-populated ccm clusters that are cloned instead of rebuilt.
+
+A template is a cluster that has been populated, started once (so that the
+system keyspaces, tokens and schema are already on disk) and then stopped.
+Each test that asks for an identical cluster gets a copy of the template
+directory in which the sstables are hardlinked and only the mutable files
+(configuration, commitlog, caches) are copied.
+"""
+import errno
+import hashlib
+import json
+import os
+import shutil
+
+from ccmlib.cluster import Cluster
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where worker processes do not lock each other out
+    fcntl = None
+
+READY_MARKER = 'template.ready'
+
+# Cassandra never rewrites an sstable component in place (new components are
+# written to a temporary file and renamed), so these can safely be shared
+# between the template and all of its clones.
+IMMUTABLE_SUFFIXES = ('.db', '.crc32', '.adler32', '.sha1', '.txt')
+
+
+def template_key(install, nodes, partitioner, config_options, log_level, ipprefix='127.0.0.'):
+    """
+    Returns a stable identifier for the cluster described by the arguments.
+    """
+    description = json.dumps({
+        'install': install,
+        'nodes': nodes,
+        'partitioner': partitioner,
+        'config_options': config_options,
+        'log_level': log_level,
+        'ipprefix': ipprefix,
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(description).hexdigest()
+
+
+class ClusterTemplatePool(object):
+    """
+    Builds templates on demand under root and clones them into test directories.
+
+    Building is serialized with a file lock per template, so several test
+    processes can share the same pool.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+        try:
+            os.makedirs(root)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def template_path(self, key):
+        return os.path.join(self.root, key)
+
+    def clone(self, key, name, dest_path, builder):
+        """
+        Copies the template identified by key into dest_path/name, building
+        it first with builder(path, name) if it does not exist yet.
+        """
+        template = self.template_path(key)
+        with open(template + '.lock', 'w') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(os.path.join(template, READY_MARKER)):
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    self._build(template, name, builder)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        self._copy_tree(os.path.join(template, name), os.path.join(dest_path, name))
+
+    def _build(self, template, name, builder):
+        building = template + '.building'
+        for path in (template, building):
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        os.mkdir(building)
+        builder(building, name)
+        open(os.path.join(building, READY_MARKER), 'w').close()
+        os.rename(building, template)
+
+    def _copy_tree(self, src, dst):
+        for dirpath, dirnames, filenames in os.walk(src):
+            relative = os.path.relpath(dirpath, src)
+            target_dir = os.path.normpath(os.path.join(dst, relative))
+            if not os.path.exists(target_dir):
+                os.makedirs(target_dir)
+            parts = relative.split(os.sep)
+            # logs of the initialisation run would show up in the error scan
+            if 'logs' in parts:
+                continue
+            shared = 'data' in parts
+            for filename in filenames:
+                if filename.endswith('.pid'):
+                    continue
+                source = os.path.join(dirpath, filename)
+                target = os.path.join(target_dir, filename)
+                # os.link does not exist on Windows with python 2
+                if shared and filename.endswith(IMMUTABLE_SUFFIXES) and hasattr(os, 'link'):
+                    try:
+                        os.link(source, target)
+                        continue
+                    except OSError:
+                        # cross-device or unsupported, fall back to a copy
+                        pass
+                shutil.copy2(source, target)
+
+
+def build_template(path, name, nodes, install, partitioner, config_options, log_level, ipprefix='127.0.0.', prepare=None):
+    """
+    Creates, initialises and stops a cluster at path/name.
+
+    install is a (version, install_dir) pair, only one of which is set.
+    prepare, if given, is called with the populated cluster before it starts.
+    """
+    version, install_dir = install
+    if version:
+        cluster = Cluster(path, name, cassandra_version=version)
+    else:
+        cluster = Cluster(path, name, cassandra_dir=install_dir)
+    if partitioner:
+        cluster.set_partitioner(partitioner)
+    cluster.set_configuration_options(values=config_options)
+    cluster.populate(nodes, ipprefix=ipprefix)
+    if prepare is not None:
+        prepare(cluster)
+    if log_level:
+        cluster.set_log_level(log_level)
+    try:
+        cluster.start(wait_for_binary_proto=True, wait_other_notice=True)
+    finally:
+        cluster.stop(gently=True)
+    return cluster
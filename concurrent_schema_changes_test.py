@@ -34,7 +34,7 @@ class TestConcurrentSchemaChanges(Tester):
             );
         """ % namespace
         session.execute(query)
-        wait(1)
+        self.wait_for_schema_agreement(session)
         session.execute("INSERT INTO cf_%s (col1, col2, col3) VALUES ('a', 'b', 'c');"
                 % namespace)
 
@@ -72,7 +72,7 @@ class TestConcurrentSchemaChanges(Tester):
         session.execute('USE ks_%s' % namespace)
         # drop keyspace
         session.execute('DROP KEYSPACE ks2_%s' % namespace)
-        wait(2)
+        self.wait_for_schema_agreement(session)
 
         # create keyspace
         self.create_ks(session, "ks3_%s" % namespace, 2)
@@ -143,16 +143,14 @@ class TestConcurrentSchemaChanges(Tester):
         cursor = self.cql_connection(node1)
         self.prepare_for_changes(cursor, namespace='ns1')
         self.make_schema_changes(cursor, namespace='ns1')
-        wait(3)
+        # wait for changes to get to the second node
+        self.wait_for_schema_agreement(cursor)
         self.validate_schema_consistent(node1)
 
-        # wait for changes to get to the first node
-        wait(20)
-
         cursor = self.cql_connection(node2)
         self.prepare_for_changes(cursor, namespace='ns2')
         self.make_schema_changes(cursor, namespace='ns2')
-        wait(3)
+        self.wait_for_schema_agreement(cursor)
         self.validate_schema_consistent(node1)
         # check both, just because we can
         self.validate_schema_consistent(node2)
@@ -178,9 +176,9 @@ class TestConcurrentSchemaChanges(Tester):
         wait(2)
         node2.stop()
         wait(2)
-        node1.start()
-        node2.start()
-        wait(20)
+        node1.start(wait_for_binary_proto=True)
+        node2.start(wait_for_binary_proto=True)
+        self.wait_for_schema_agreement()
         self.validate_schema_consistent(node1)
 
 
@@ -206,9 +204,9 @@ class TestConcurrentSchemaChanges(Tester):
         wait(2)
         node2.stop()
         wait(2)
-        node1.start()
-        node2.start()
-        wait(20)
+        node1.start(wait_for_binary_proto=True)
+        node2.start(wait_for_binary_proto=True)
+        self.wait_for_schema_agreement()
         self.validate_schema_consistent(node1)
 
 
@@ -5,7 +5,7 @@ import time
 from collections import OrderedDict
 from uuid import uuid4, UUID
 
-from dtest import Tester, canReuseCluster, freshCluster
+from dtest import Tester, canReuseCluster, freshCluster, wait_until, all_nodes_up, index_built
 from pyassertions import assert_invalid, assert_one, assert_none, assert_all
 from pytools import since, require, rows_to_list
 from cassandra import ConsistencyLevel, InvalidRequest
@@ -21,24 +21,16 @@ cql_version="3.0.0"
 @canReuseCluster
 class TestCQL(Tester):
 
-    def prepare(self, ordered=False, create_keyspace=True, use_cache=False, nodes=1, rf=1):
-        cluster = self.cluster
-
-        if (ordered):
-            cluster.set_partitioner("org.apache.cassandra.dht.ByteOrderedPartitioner")
-
-        if (use_cache):
-            cluster.set_configuration_options(values={ 'row_cache_size_in_mb' : 100 })
+    node_profile = 'fast'
 
-        if not cluster.nodelist():
-            cluster.populate(nodes).start()
+    def prepare(self, ordered=False, create_keyspace=True, use_cache=False, nodes=1, rf=1):
+        partitioner = "org.apache.cassandra.dht.ByteOrderedPartitioner" if ordered else None
+        config_options = { 'row_cache_size_in_mb' : 100 } if use_cache else None
+        cluster = self.prepare_cluster(nodes, partitioner=partitioner, config_options=config_options)
         node1 = cluster.nodelist()[0]
-        time.sleep(0.2)
 
         session = self.patient_cql_connection(node1, version=cql_version)
         if create_keyspace:
-            if self._preserve_cluster:
-                session.execute("DROP KEYSPACE IF EXISTS ks")
             self.create_ks(session, 'ks', rf)
         return session
 
@@ -1279,7 +1271,7 @@ class TestCQL(Tester):
         # Uses 3 nodes just to make sure RowMutation are correctly serialized
         cluster.populate(3).start()
         node1 = cluster.nodelist()[0]
-        time.sleep(0.2)
+        wait_until(all_nodes_up(cluster.nodelist()))
 
         cursor = self.patient_cql_connection(node1, version=cql_version)
         self.create_ks(cursor, 'ks', 1)
@@ -1294,7 +1286,7 @@ class TestCQL(Tester):
                 PRIMARY KEY (k, c1, c2)
             );
         """)
-        time.sleep(1)
+        self.wait_for_schema_agreement(cursor)
 
         rows = 5
         col1 = 2
@@ -1318,7 +1310,6 @@ class TestCQL(Tester):
             assert rows_to_list(res) == [[x, x] for x in xrange(i * cpr + col1, (i + 1) * cpr)], res
 
         cluster.flush()
-        time.sleep(0.2)
 
         for i in xrange(0, rows):
             res = cursor.execute("SELECT v1, v2 FROM test1 WHERE k = %d" % i)
@@ -1793,7 +1784,7 @@ class TestCQL(Tester):
 
         cluster.populate(2).start()
         node1 = cluster.nodelist()[0]
-        time.sleep(0.2)
+        wait_until(all_nodes_up(cluster.nodelist()))
 
         cursor = self.patient_cql_connection(node1, version=cql_version)
         self.create_ks(cursor, 'ks', 1)
@@ -1804,7 +1795,7 @@ class TestCQL(Tester):
                 v int
             );
         """)
-        time.sleep(1)
+        self.wait_for_schema_agreement(cursor)
 
         cursor.execute("INSERT INTO test (k, v) VALUES ('foo', 0)")
         cursor.execute("INSERT INTO test (k, v) VALUES ('bar', 1)")
@@ -2035,7 +2026,7 @@ class TestCQL(Tester):
         cursor.execute(req % (1, 0, "bob", "5th post"))
 
         cursor.execute("CREATE INDEX ON test(author)")
-        time.sleep(1)
+        wait_until(index_built(cursor, 'ks', 'test', 'test_author_idx'), timeout=30)
 
         res = cursor.execute("SELECT blog_id, timestamp FROM test WHERE author = 'bob'")
         assert rows_to_list(res) == [[1, 0], [0, 0], [0, 2]], res
@@ -2926,14 +2917,13 @@ class TestCQL(Tester):
 
         cursor.execute("UPDATE t1 SET t = '111' WHERE id = 1;")
         cursor.execute("ALTER TABLE t1 ADD l list<text>;")
-
-        time.sleep(.5)
+        self.wait_for_schema_agreement(cursor)
 
         res = cursor.execute("SELECT * FROM t1;")
         assert rows_to_list(res) == [[1, None, '111']], res
 
         cursor.execute("ALTER TABLE t1 ADD m map<int, text>;")
-        time.sleep(.5)
+        self.wait_for_schema_agreement(cursor)
         res = cursor.execute("SELECT * FROM t1;")
         assert rows_to_list(res) == [[1, None, None, '111']], res
 
@@ -2993,8 +2983,7 @@ class TestCQL(Tester):
                 + "and key_validation_class=UTF8Type and default_validation_class=UTF8Type");
         cli.do("set test['foo']['4:3:2'] = 'bar'")
         assert not cli.has_errors(), cli.errors()
-
-        time.sleep(1)
+        self.wait_for_schema_agreement(cursor)
 
         cursor.execute("ALTER TABLE test RENAME column1 TO foo1 AND column2 TO foo2 AND column3 TO foo3")
         assert_one(cursor, "SELECT foo1, foo2, foo3 FROM test", [4, 3, 2])
@@ -0,0 +1,73 @@
+"""
+Deterministic, seekable test data.
+
+Every value is a pure function of (seed, table, index, column, version), so
+a test only has to remember how many rows it wrote, not what it wrote: any
+range of indexes can be regenerated, by any thread or process, to be
+written or checked. version lets the same row take a new value when it is
+overwritten.
+
+Values come from the splitmix64 sequence. The stream of a (seed, table,
+column, version) starts at a hash of those and index i is the i-th element,
+so computing one value costs a few integer operations and a batch is a
+single pass over its range.
+"""
+import hashlib
+import struct
+import uuid
+
+MASK = (1 << 64) - 1
+GAMMA = 0x9E3779B97F4A7C15
+
+
+def _mix(z):
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+
+class DataGenerator(object):
+
+    def __init__(self, seed, table):
+        self.seed = seed
+        self.table = table
+        # stream start of each (column, version); there are only a handful
+        self._streams = {}
+
+    def _stream(self, column, version):
+        key = (column, version)
+        if key not in self._streams:
+            digest = hashlib.md5('%s\0%s\0%s\0%s' % (self.seed, self.table, column, version)).digest()
+            self._streams[key] = struct.unpack('<Q', digest[:8])[0]
+        return self._streams[key]
+
+    def integer(self, index, column, version=0):
+        """Returns the 64 bit unsigned value of column for row index"""
+        return _mix((self._stream(column, version) + (index + 1) * GAMMA) & MASK)
+
+    def integers(self, start, stop, column, version=0):
+        """Returns the integer values of column for the rows start to stop (exclusive)"""
+        base = self._stream(column, version)
+        return [_mix((base + (index + 1) * GAMMA) & MASK) for index in xrange(start, stop)]
+
+    def text(self, index, column, version=0, length=16):
+        """Returns a hex string of length characters"""
+        return self._text(self.integer(index, column, version), index, column, version, length)
+
+    def texts(self, start, stop, column, version=0, length=16):
+        return [self._text(value, index, column, version, length)
+                for index, value in zip(xrange(start, stop), self.integers(start, stop, column, version))]
+
+    def uuid(self, index, column, version=0):
+        """Returns a random-looking (version 4) UUID"""
+        high = self.integer(index, column, version)
+        low = self.integer(index, column + '#low', version)
+        return uuid.UUID(int=(high << 64) | low, version=4)
+
+    def _text(self, value, index, column, version, length):
+        text = '%016x' % value
+        part = 1
+        while len(text) < length:
+            text += '%016x' % self.integer(index, '%s#%d' % (column, part), version)
+            part += 1
+        return text[:length]
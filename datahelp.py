@@ -1,5 +1,10 @@
+import bisect
+import collections
+import itertools
 import re
-from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.query import BatchStatement, BatchType
+from cassandra.util import sortedset
 
 
 def strip(val):
@@ -65,7 +70,10 @@ def parse_row_into_dict(row, headers, format_funcs=None):
     return row_map
 
 
-def parse_data_into_dicts(data, format_funcs=None):
+def split_data(data):
+    """
+    Returns the headers of data and the list of its (unparsed) rows.
+    """
     # throw out leading/trailing space and pipes
     # so we can split on the data without getting
     # extra empty fields
@@ -76,19 +84,142 @@ def parse_data_into_dicts(data, format_funcs=None):
 
     # remove headers
     headers = parse_headers_into_list(rows.pop(0))
+    return headers, rows
 
-    values = []
+
+def iter_data_rows(data, format_funcs=None):
+    """
+    Yields the rows of data as dicts, one at a time, so that the rows
+    of a multiplier like *10000 are never all in memory.
+    """
+    headers, rows = split_data(data)
 
     for row in rows:
-        if row_has_multiplier(row):
-            values.extend(parse_row_into_dict(row, headers, format_funcs=format_funcs))
+        row_multiplier = get_row_multiplier(row)
+        if row_multiplier is not None:
+            row = '|'.join(l.strip() for l in row.split('|')[1:])
+            for i in xrange(row_multiplier):
+                yield parse_row_into_dict(row, headers, format_funcs=format_funcs)
         else:
-            values.append(parse_row_into_dict(row, headers, format_funcs=format_funcs))
+            yield parse_row_into_dict(row, headers, format_funcs=format_funcs)
 
-    return values
 
+def parse_data_into_dicts(data, format_funcs=None):
+    return list(iter_data_rows(data, format_funcs=format_funcs))
 
-def create_rows(data, cursor, table_name, cl=None, format_funcs=None, prefix='', postfix=''):
+
+class ExpectedRows(object):
+    """
+    Ordered record of the rows written by create_rows, which can be used
+    where a list of dicts would be: len(), iteration, indexing, slicing,
+    append(), membership of a row dict and equality with a list of dicts.
+
+    A row is kept as the tuple of its values in column order, and runs of
+    identical rows (as multiplier rows without a random format function
+    produce) are kept once with their count.
+    """
+
+    def __init__(self, columns, rows=()):
+        self.columns = tuple(columns)
+        self._runs = []  # [values, count]
+        self._ends = []  # index following the last row of each run
+        self._counts = None  # values -> count, built for membership tests
+        for row in rows:
+            self.append(row)
+
+    def _values(self, row):
+        if len(row) != len(self.columns):
+            raise ValueError("row %s does not have the columns %s" % (row, self.columns))
+        return tuple(row[column] for column in self.columns)
+
+    def _row(self, values):
+        return dict(zip(self.columns, values))
+
+    def _iter_values(self):
+        for values, count in self._runs:
+            for i in xrange(count):
+                yield values
+
+    def append(self, row):
+        values = self._values(row)
+        if self._runs and self._runs[-1][0] == values:
+            self._runs[-1][1] += 1
+            self._ends[-1] += 1
+        else:
+            self._runs.append([values, 1])
+            self._ends.append(len(self) + 1)
+        self._counts = None
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return self._ends[-1] if self._ends else 0
+
+    def __iter__(self):
+        for values in self._iter_values():
+            yield self._row(values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step > 0:
+                values = itertools.islice(self._iter_values(), start, stop, step)
+            else:
+                values = (self._runs[bisect.bisect_right(self._ends, i)][0] for i in xrange(start, stop, step))
+            return ExpectedRows(self.columns, (self._row(v) for v in values))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return self._row(self._runs[bisect.bisect_right(self._ends, index)][0])
+
+    def __contains__(self, row):
+        try:
+            values = self._values(row)
+        except (KeyError, ValueError):
+            return False
+        try:
+            if self._counts is None:
+                self._counts = collections.Counter()
+                for run_values, count in self._runs:
+                    self._counts[run_values] += count
+            return values in self._counts
+        except TypeError:
+            # unhashable values, e.g. collections
+            self._counts = None
+            return any(values == run_values for run_values, count in self._runs)
+
+    def __eq__(self, other):
+        try:
+            if len(self) != len(other):
+                return False
+        except TypeError:
+            return NotImplemented
+        return all(mine == theirs for mine, theirs in itertools.izip(self, other))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self):
+        return "<ExpectedRows %d rows of %s>" % (len(self), ', '.join(self.columns))
+
+    def flatten(self):
+        return flatten(self)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def create_rows(data, cursor, table_name, cl=None, format_funcs=None, prefix='', postfix='', chunk_size=1000, batch_by=None):
     """
     Creates db rows using given cursor, with table name provided,
     using data formatted like:
@@ -99,32 +230,121 @@ def create_rows(data, cursor, table_name, cl=None, format_funcs=None, prefix='',
     format_funcs should be a dictionary of {columnname: function} if data needs to be formatted
     before being included in CQL.
 
-    Returns a list of maps describing the data created.
+    The rows are parsed and inserted chunk_size at a time. If batch_by is
+    the list of the partition key columns, the rows of a chunk that share a
+    partition are inserted with one unlogged batch.
+
+    Returns an ExpectedRows describing the data created.
     """
-    values = []
-    dicts = parse_data_into_dicts(data, format_funcs=format_funcs)
+    headers, rows = split_data(data)
 
-    # use the first dictionary to build a prepared statement for all
     prepared = cursor.prepare(
         "{prefix} INSERT INTO {table} ({cols}) values ({vals}) {postfix}".format(
-            prefix=prefix, table=table_name, cols=', '.join(dicts[0].keys()),
-            vals=', '.join('?' for k in dicts[0].keys()), postfix=postfix)
+            prefix=prefix, table=table_name, cols=', '.join(headers),
+            vals=', '.join('?' for k in headers), postfix=postfix)
     )
     if cl is not None:
         prepared.consistency_level = cl
 
-    query_results = execute_concurrent_with_args(cursor, prepared, [d.values() for d in dicts])
-
-    for i, (status, result_or_exc) in enumerate(query_results):
-        # should maybe check status here before appening to expected values
-        values.append(dicts[i])
+    values = ExpectedRows(headers)
+    for chunk in _chunks(iter_data_rows(data, format_funcs=format_funcs), chunk_size):
+        if batch_by:
+            batches = collections.OrderedDict()
+            for row in chunk:
+                partition = tuple(row[column] for column in batch_by)
+                if partition not in batches:
+                    batches[partition] = BatchStatement(batch_type=BatchType.UNLOGGED, consistency_level=prepared.consistency_level)
+                batches[partition].add(prepared, [row[h] for h in headers])
+            execute_concurrent(cursor, [(batch, None) for batch in batches.values()])
+        else:
+            execute_concurrent_with_args(cursor, prepared, [[row[h] for h in headers] for row in chunk])
+        values.extend(chunk)
 
     return values
 
 
-def flatten_into_set(iterable):
-    # use flatten() then convert to a set for set comparisons
-    return set(flatten(iterable))
+MAX_REPORTED_ROWS = 10
+
+
+def _hashable(value):
+    # collections come back from the driver as lists, tuples, sets, dicts or
+    # its own sortedset and OrderedMap. OrderedMap is a Mapping, but without
+    # blist the driver's sortedset is not registered as a Set.
+    if value is None or isinstance(value, (basestring, int, long, float)):
+        return value
+    if isinstance(value, collections.Mapping):
+        return frozenset((_hashable(k), _hashable(v)) for k, v in value.items())
+    if isinstance(value, (collections.Set, sortedset)):
+        return frozenset(_hashable(v) for v in value)
+    if isinstance(value, collections.Sequence):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def row_digest(row):
+    """
+    Returns a fixed width digest of a row dict, which does not depend on the
+    order of its keys and is the same for rows that compare equal.
+    """
+    # the values cannot be hashed as they are: the driver's sortedset hashes
+    # by identity, so it would never match an equal set
+    return hash(frozenset((key, _hashable(value)) for key, value in row.iteritems()))
+
+
+def digest_rows(rows):
+    """Returns the multiset of the digests of rows, as a Counter"""
+    return collections.Counter(row_digest(row) for row in rows)
+
+
+def _matching_rows(rows, digests):
+    # the rows whose digests are in the digests Counter, as many times as it counts them
+    remaining = collections.Counter(digests)
+    matching = []
+    for row in rows:
+        digest = row_digest(row)
+        if remaining[digest] > 0:
+            remaining[digest] -= 1
+            matching.append(row)
+            if len(matching) == MAX_REPORTED_ROWS:
+                break
+    return matching
+
+
+def compare_rows(actual, expected, subset=False):
+    """
+    Compares two collections of row dicts, ignoring order but counting
+    duplicates. With subset, every row of actual only needs to be found in
+    expected, however many times either holds it.
+
+    Rows are compared by digest, so only the rows that differ are ever
+    formatted, and two different rows only get mixed up on a collision of
+    their digests. Returns None if the rows match, or else a message listing
+    (the first MAX_REPORTED_ROWS of) the unexpected and missing rows.
+    """
+    # the rows that differ are found with a second pass
+    if iter(actual) is actual:
+        actual = list(actual)
+    if iter(expected) is expected:
+        expected = list(expected)
+
+    actual_digests = digest_rows(actual)
+    expected_digests = digest_rows(expected)
+    if subset:
+        unexpected = collections.Counter(dict((digest, count) for digest, count in actual_digests.iteritems()
+                                              if digest not in expected_digests))
+        missing = collections.Counter()
+    else:
+        unexpected = actual_digests - expected_digests
+        missing = expected_digests - actual_digests
+    if not unexpected and not missing:
+        return None
+
+    message = ["{} rows, {} expected".format(sum(actual_digests.values()), sum(expected_digests.values()))]
+    for name, rows, digests in (('unexpected', actual, unexpected), ('missing', expected, missing)):
+        if digests:
+            message.append("{} {} rows, including:".format(sum(digests.values()), name))
+            message.extend('    {}'.format(row) for row in _matching_rows(rows, digests))
+    return '\n'.join(message)
 
 
 def flatten(list_of_dicts):
@@ -0,0 +1,30 @@
+from unittest import TestCase
+
+from cassandra.util import OrderedMap, sortedset
+
+from datahelp import compare_rows, row_digest
+
+
+class TestCompareRows(TestCase):
+    """
+    compare_rows against the collection types that the driver returns,
+    which need no cluster.
+    """
+
+    def driver_sortedset_test(self):
+        self.assertIsNone(compare_rows([{'k': 0, 'v': sortedset([1, 2])}], [{'k': 0, 'v': set([2, 1])}]))
+        self.assertIsNotNone(compare_rows([{'k': 0, 'v': sortedset([1])}], [{'k': 0, 'v': set([1, 2])}]))
+
+    def driver_ordered_map_test(self):
+        actual = [{'k': 0, 'v': OrderedMap([('a', sortedset([1])), ('b', [2, 3])])}]
+        expected = [{'k': 0, 'v': {'b': [2, 3], 'a': set([1])}}]
+        self.assertEqual(row_digest(actual[0]), row_digest(expected[0]))
+        self.assertIsNone(compare_rows(actual, expected))
+
+    def duplicates_test(self):
+        row = {'k': 0, 'v': sortedset(['a'])}
+        self.assertIsNotNone(compare_rows([row, row], [row]))
+        # a subset only has to hold rows of the superset, however many times
+        self.assertIsNone(compare_rows([row, row], [row], subset=True))
+        self.assertIsNone(compare_rows([row], [row, row, {'k': 1, 'v': None}], subset=True))
+        self.assertIsNotNone(compare_rows([{'k': 1, 'v': None}], [row], subset=True))
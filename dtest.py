@@ -1,17 +1,27 @@
 from __future__ import with_statement
-import os, tempfile, sys, shutil, subprocess, types, time, threading, traceback, ConfigParser, logging, fnmatch, re, copy
+import os, tempfile, sys, shutil, subprocess, types, time, threading, traceback, ConfigParser, logging, fnmatch, re, copy, socket, mmap
 
 from ccmlib.cluster import Cluster
 from ccmlib.cluster_factory import ClusterFactory
 from ccmlib.node import Node
-from ccmlib.common import is_win
+from ccmlib.common import is_win, get_version_from_build
+from ccmlib import repository
 from uuid import UUID
 from nose.exc import SkipTest
 from unittest import TestCase
+from contextlib import contextmanager
 from cassandra.cluster import NoHostAvailable
 from cassandra.cluster import Cluster as PyCluster
 from cassandra.auth import PlainTextAuthProvider
 from cassandra.policies import WhiteListRoundRobinPolicy
+from cluster_templates import ClusterTemplatePool, template_key, build_template
+from worker_allocator import current_allocation
+from log_archiver import LogArchiver
+from cluster_reaper import ClusterJournal, ClusterReaper
+from tmpfs_placement import TmpfsPlacement, FootprintHistory, NODE_SUBDIRS, directory_size
+from phase_profiler import PhaseProfiler
+from cluster_reuse import ReuseScheduler
+from node_profiles import get_profile, record_node_stats
 
 LOG_SAVED_DIR="logs"
 try:
@@ -21,8 +31,6 @@ except OSError:
 
 LAST_LOG = os.path.join(LOG_SAVED_DIR, "last")
 
-LAST_TEST_DIR='last_test_dir'
-
 DEFAULT_DIR='./'
 config = ConfigParser.RawConfigParser()
 if len(config.read(os.path.expanduser('~/.cassandra-dtest'))) > 0:
@@ -38,11 +46,32 @@ PRINT_DEBUG = os.environ.get('PRINT_DEBUG', '').lower() in ('yes', 'true')
 DISABLE_VNODES = os.environ.get('DISABLE_VNODES', '').lower() in ('yes', 'true')
 OFFHEAP_MEMTABLES = os.environ.get('OFFHEAP_MEMTABLES', '').lower() in ('yes', 'true')
 NUM_TOKENS = os.environ.get('NUM_TOKENS', '256')
+NODE_PROFILE = os.environ.get('NODE_PROFILE', '').lower()
 RECORD_COVERAGE = os.environ.get('RECORD_COVERAGE', '').lower() in ('yes', 'true')
 REUSE_CLUSTER = os.environ.get('REUSE_CLUSTER', '').lower() in ('yes', 'true')
+SYNC_TEARDOWN = os.environ.get('SYNC_TEARDOWN', '').lower() in ('yes', 'true')
+PROFILE_PHASES = os.environ.get('PROFILE_PHASES', '').lower() in ('yes', 'true')
+TMPFS_CLUSTERS = os.environ.get('TMPFS_CLUSTERS', '').lower() in ('yes', 'true')
+TMPFS_DIR = os.environ.get('TMPFS_DIR', '/dev/shm')
+TMPFS_RESERVE_MB = int(os.environ.get('TMPFS_RESERVE_MB', '1024'))
+TMPFS_NODE_FOOTPRINT_MB = int(os.environ.get('TMPFS_NODE_FOOTPRINT_MB', '256'))
+CLUSTER_TEMPLATES = os.environ.get('CLUSTER_TEMPLATES', '').lower() in ('yes', 'true')
+ARCHIVE_LOGS = os.environ.get('ARCHIVE_LOGS', '').lower() in ('yes', 'true')
+ARCHIVE_TAIL_MB = float(os.environ.get('ARCHIVE_TAIL_MB', '64'))
+ARCHIVE_EXTRAS = set(extra.strip() for extra in os.environ.get('ARCHIVE_EXTRAS', '').split(',') if extra.strip())
+CLUSTER_TEMPLATE_DIR = os.environ.get('CLUSTER_TEMPLATE_DIR', os.path.join(tempfile.gettempdir(), 'dtest-templates'))
 
 
 CURRENT_TEST = ""
+TEMPLATE_POOL = None
+INSTALLED_VERSIONS = {}
+REAPERS = {}
+PLACEMENT = TmpfsPlacement(TMPFS_DIR, TMPFS_RESERVE_MB * 1024 * 1024,
+                           FootprintHistory(os.path.join(LOG_SAVED_DIR, 'footprints.json')))
+LOG_ARCHIVER = LogArchiver(tail_bytes=int(ARCHIVE_TAIL_MB * 1024 * 1024) if ARCHIVE_TAIL_MB > 0 else None)
+PROFILER = PhaseProfiler(os.path.join(LOG_SAVED_DIR, 'phases.jsonl'), enabled=PROFILE_PHASES)
+if PROFILE_PHASES:
+    PROFILER.install()
 
 logging.basicConfig(filename=os.path.join(LOG_SAVED_DIR,"dtest.log"),
                     filemode='w',
@@ -65,6 +94,9 @@ def debug(msg):
     if PRINT_DEBUG:
         print msg
 
+REUSE_SCHEDULER = ReuseScheduler(log=debug)
+
+@PROFILER.timed('retry_till_success')
 def retry_till_success(fun, *args, **kwargs):
     timeout = kwargs.pop('timeout', 60)
     bypassed_exception = kwargs.pop('bypassed_exception', Exception)
@@ -83,6 +115,190 @@ def retry_till_success(fun, *args, **kwargs):
 def is_win():
     return True if sys.platform == "cygwin" or sys.platform == "win32" else False
 
+@PROFILER.timed('wait_until')
+def wait_until(predicate, timeout=60, interval=None, max_interval=1.0):
+    """
+    Polls predicate until it returns a true value, and returns that value.
+
+    The first check happens immediately, so a state that has already been
+    reached costs a single call. After that the delay between checks doubles
+    from interval up to max_interval. interval defaults to the predicate's
+    poll_interval attribute if it has one, 0.01 otherwise: predicates that
+    run nodetool set it, since each check spawns a JVM. How long the wait
+    took is logged.
+
+    Raises RuntimeError if the predicate is still false after timeout seconds.
+    """
+    description = getattr(predicate, '__name__', repr(predicate))
+    start = time.time()
+    deadline = start + timeout
+    if interval is None:
+        interval = getattr(predicate, 'poll_interval', 0.01)
+    max_interval = max(max_interval, interval)
+    delay = interval
+    while True:
+        result = predicate()
+        if result:
+            debug("waited {:.3f}s until {}".format(time.time() - start, description))
+            return result
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise RuntimeError("Timed out after {}s waiting until {}".format(timeout, description))
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_interval)
+
+# seconds between two checks of a predicate that runs nodetool
+NODETOOL_POLL_INTERVAL = 1.0
+
+def _running(nodes):
+    if isinstance(nodes, Node):
+        nodes = [nodes]
+    return [node for node in nodes if node.is_running()]
+
+def all_nodes_up(nodes):
+    """Predicate: every running node in nodes sees all the others as UN in nodetool status"""
+    def all_nodes_up():
+        running = _running(nodes)
+        addresses = set(node.network_interfaces['storage'][0] for node in running)
+        for node in running:
+            output = node.nodetool('status', True)[0]
+            up = set(line.split()[1] for line in output.splitlines() if line.startswith('UN'))
+            if not addresses <= up:
+                return False
+        return True
+    all_nodes_up.poll_interval = NODETOOL_POLL_INTERVAL
+    return all_nodes_up
+
+def no_pending_compactions(nodes):
+    """
+    Predicate: no running node in nodes has pending or active compactions.
+    Active ones are the rows listed under the "compaction type" header of
+    nodetool compactionstats.
+    """
+    def no_pending_compactions():
+        for node in _running(nodes):
+            output = node.nodetool('compactionstats', True)[0]
+            match = re.search(r'pending tasks: (\d+)', output)
+            if match is None or int(match.group(1)) != 0:
+                return False
+            lines = output.splitlines()
+            for i, line in enumerate(lines):
+                if 'compaction type' in line.lower():
+                    for row in lines[i + 1:]:
+                        if row.strip() and not row.strip().startswith('Active compaction remaining time'):
+                            return False
+        return True
+    no_pending_compactions.poll_interval = NODETOOL_POLL_INTERVAL
+    return no_pending_compactions
+
+def streams_finished(nodes):
+    """Predicate: no running node in nodes is sending or receiving streams"""
+    def streams_finished():
+        for node in _running(nodes):
+            output = node.nodetool('netstats', True)[0]
+            if re.search(r'^\s*(Sending|Receiving) \d+ files|^Streaming (to|from):', output, re.MULTILINE):
+                return False
+        return True
+    streams_finished.poll_interval = NODETOOL_POLL_INTERVAL
+    return streams_finished
+
+def hints_delivered(session):
+    """Predicate: the coordinator behind session has no stored hints left"""
+    def hints_delivered():
+        return len(session.execute("SELECT target_id FROM system.hints LIMIT 1")) == 0
+    return hints_delivered
+
+def index_built(session, keyspace, table, index):
+    """Predicate: the node behind session has finished building index of keyspace.table"""
+    def index_built():
+        rows = session.execute("""SELECT index_name FROM system."IndexInfo" WHERE table_name = '%s'""" % keyspace)
+        return '%s.%s' % (table, index) in [row[0] for row in rows]
+    return index_built
+
+def schema_agreed(sessions, live_addresses=None):
+    """
+    Predicate: the nodes behind sessions all report the same schema version,
+    both for themselves and for their peers. If live_addresses is given,
+    peers that are not in it are ignored.
+    """
+    def schema_agreed():
+        versions = set()
+        try:
+            for session in sessions:
+                versions.update(row[0] for row in session.execute("SELECT schema_version FROM system.local"))
+                for peer, version in session.execute("SELECT peer, schema_version FROM system.peers"):
+                    # a joining peer does not know its schema version yet
+                    if version is not None and (live_addresses is None or peer in live_addresses):
+                        versions.add(version)
+        except NoHostAvailable:
+            # the driver has not reconnected to a restarted node yet
+            return False
+        return len(versions) == 1
+    return schema_agreed
+
+def installed_cassandra_version():
+    """
+    Returns the version of the cassandra that CASSANDRA_VERSION or
+    CASSANDRA_DIR point to, as the clusters of _get_cluster would see it.
+    It is resolved only once per process for each setting.
+    """
+    key = (os.environ.get('CASSANDRA_VERSION'), os.environ.get('CASSANDRA_DIR', DEFAULT_DIR))
+    if key not in INSTALLED_VERSIONS:
+        version, cdir = key
+        if version:
+            cdir, resolved = repository.setup(version)
+            if resolved is None:
+                # git branches only know their version once built
+                resolved = get_version_from_build(cdir)
+        else:
+            resolved = get_version_from_build(cdir)
+        INSTALLED_VERSIONS[key] = str(resolved)
+    return INSTALLED_VERSIONS[key]
+
+def port_is_open(address, port, timeout=1):
+    """Returns True if something accepts TCP connections on address:port"""
+    try:
+        sock = socket.create_connection((address, int(port)), timeout)
+    except socket.error:
+        return False
+    sock.close()
+    return True
+
+def cluster_reaper():
+    """Returns the reaper of this process, whose journal is private to its worker"""
+    pid = os.getpid()
+    if pid not in REAPERS:
+        REAPERS[pid] = ClusterReaper(ClusterJournal(current_allocation().journal_path), log=debug)
+    return REAPERS[pid]
+
+def reclaim_leftover_clusters(keep_last=False):
+    """
+    Hands every cluster of the journal that is not already being reclaimed
+    to the reaper. These are left behind by tests that preserved their
+    cluster or by an execution that was interrupted before tearDown (e.g.
+    by KeyboardInterrupt).
+
+    If keep_last is set the most recent cluster is kept and returned as
+    (path, cluster), or None if there is none.
+    """
+    reaper = cluster_reaper()
+    in_flight = reaper.in_flight()
+    leftovers = [(path, name) for path, name in reaper.journal.pending() if path not in in_flight]
+    kept = None
+    for i, (test_path, name) in enumerate(leftovers):
+        try:
+            cluster = ClusterFactory.load(test_path, name)
+        except IOError:
+            # after a restart, /tmp will be emptied so we'll get an IOError when loading the old cluster here
+            reaper.journal.reaped(test_path, name)
+            continue
+        if keep_last and i == len(leftovers) - 1:
+            kept = (test_path, cluster)
+        else:
+            reaper.reap(cluster, test_path, remove=not KEEP_TEST_DIR, gently=RECORD_COVERAGE,
+                        sync=SYNC_TEARDOWN, after=PLACEMENT.release)
+    return kept
+
 class Runner(threading.Thread):
     def __init__(self, func):
         threading.Thread.__init__(self)
@@ -114,8 +330,133 @@ class Runner(threading.Thread):
             raise self.__error
 
 
+class LogErrorScanner(object):
+    """
+    Finds the ERROR lines written to node logs since they were last scanned.
+
+    The offset reached in each log is remembered (keyed by path and inode, so
+    a recreated log is read from the start), so a log that keeps growing
+    across tests sharing a cluster is only read once. The new part of the log
+    is mmap'd and searched for the marker directly instead of line by line.
+    """
+
+    def __init__(self, marker='ERROR'):
+        self.marker = marker
+        self.offsets = {}
+
+    def __new_range(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        inode, offset = self.offsets.get(path, (None, 0))
+        if inode != stat.st_ino or offset > stat.st_size:
+            offset = 0
+        return stat.st_ino, offset, stat.st_size
+
+    def skip(self, path):
+        """Marks everything currently in the log at path as scanned"""
+        new_range = self.__new_range(path)
+        if new_range is not None:
+            inode, offset, size = new_range
+            self.offsets[path] = (inode, size)
+
+    def scan(self, path):
+        """Returns the complete lines containing the marker written since the last scan"""
+        new_range = self.__new_range(path)
+        if new_range is None:
+            return []
+        inode, offset, size = new_range
+        if offset == size:
+            return []
+
+        lines = []
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            try:
+                # a partially written last line is left for the next scan
+                end = data.rfind('\n', offset, size) + 1
+                if end == 0:
+                    return []
+                position = data.find(self.marker, offset, end)
+                while position != -1:
+                    line_start = data.rfind('\n', offset, position) + 1
+                    line_end = data.find('\n', position, end) + 1
+                    lines.append(data[max(line_start, offset):line_end])
+                    position = data.find(self.marker, line_end, end)
+            finally:
+                data.close()
+        self.offsets[path] = (inode, end)
+        return lines
+
+
+LOG_SCANNER = LogErrorScanner()
+
+
+class ConnectionCache(object):
+    """
+    Keeps the driver Cluster built for each (node, user, protocol_version,
+    compression, whitelist) combination, so that repeated connections to a
+    node skip the control connection, event loop thread and metadata
+    refresh of a brand-new Cluster. Every connection still gets its own
+    Session, as tests change the row_factory, default_fetch_size or
+    default_timeout of the sessions they are given.
+
+    An entry is dropped, and counted as a reconnect, when the node it points
+    at has been stopped or restarted since it was created. Its cluster is
+    not shut down then, as the test may still hold sessions opened on it:
+    it is retired, and only shut down with the rest of the cache.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.retired = []
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+
+    def session(self, node, key, keyspace, new_cluster):
+        """
+        Returns a new session, using keyspace if it is not None, opened on
+        the cached cluster of key or on a new one.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            cluster, pid = entry
+            if cluster.is_shutdown or not node.is_running() or node.pid != pid:
+                self.reconnects += 1
+                self.retired.append(cluster)
+                del self.entries[key]
+                entry = None
+
+        if entry is None:
+            self.misses += 1
+            cluster = new_cluster()
+            # only cache clusters that managed to connect
+            session = cluster.connect()
+            self.entries[key] = (cluster, node.pid)
+        else:
+            self.hits += 1
+            session = cluster.connect()
+        if keyspace is not None:
+            session.execute('USE %s' % keyspace)
+        return session
+
+    def shutdown(self):
+        for cluster, pid in self.entries.values():
+            cluster.shutdown()
+        for cluster in self.retired:
+            cluster.shutdown()
+        self.entries.clear()
+        self.retired = []
+
+
 class Tester(TestCase):
 
+    # name of the node_profiles profile applied to the nodes of the class,
+    # which NODE_PROFILE overrides ('none' for no profile at all)
+    node_profile = None
+
     def __init__(self, *argv, **kwargs):
         # if False, then scan the log of each node for errors after every test.
         if not hasattr(self, '_preserve_cluster'):
@@ -150,24 +491,82 @@ class Tester(TestCase):
             if OFFHEAP_MEMTABLES:
                 cluster.set_configuration_options(values={'memtable_allocation_type': 'offheap_objects'})
 
+        cluster.populate = self._wrap_populate(cluster, name)
+
         return cluster
 
+    def _wrap_populate(self, cluster, name):
+        """
+        Wraps cluster.populate so that the nodes are created in this worker's
+        address and port block, and so that with CLUSTER_TEMPLATES a plain
+        populate(n) is served by cloning an initialised template cluster.
+
+        Anything more specific (explicit tokens, multiple datacenters, debug
+        ports) is never served from a template.
+        """
+        populate = cluster.populate
+
+        @PROFILER.timed('populate')
+        def wrapped(nodes, *args, **kwargs):
+            # the nodes of the previous cluster may still hold these addresses
+            cluster_reaper().wait_until_released()
+            allocation = current_allocation()
+            if CLUSTER_TEMPLATES and not args and not kwargs and isinstance(nodes, int) and not cluster.nodes:
+                self._clone_template(cluster, name, nodes, allocation)
+            else:
+                if allocation.index != 0:
+                    kwargs.setdefault('ipprefix', allocation.ipprefix)
+                populate(nodes, *args, **kwargs)
+            allocation.assign_ports(cluster)
+            if TMPFS_CLUSTERS:
+                placed = PLACEMENT.place(self.id(), self.test_path, cluster.nodelist(), TMPFS_NODE_FOOTPRINT_MB * 1024 * 1024)
+                self.nodes_in_ram = [node.name for node in placed]
+                debug("data and commitlog directories of {} on {}".format(self.nodes_in_ram, TMPFS_DIR))
+            return cluster
+
+        return wrapped
+
+    def _clone_template(self, cluster, name, nodes, allocation):
+        global TEMPLATE_POOL
+        if TEMPLATE_POOL is None:
+            TEMPLATE_POOL = ClusterTemplatePool(CLUSTER_TEMPLATE_DIR)
+
+        version = os.environ.get('CASSANDRA_VERSION')
+        install = (version, None if version else os.environ.get('CASSANDRA_DIR', DEFAULT_DIR))
+        log_level = 'TRACE' if TRACE else 'DEBUG' if DEBUG else None
+        config_options = dict(cluster._config_options)
+        key = template_key(install, nodes, cluster.partitioner, config_options, log_level, allocation.ipprefix)
+
+        def builder(path, cluster_name):
+            debug("building cluster template " + key + " at: " + path)
+            build_template(path, cluster_name, nodes, install, cluster.partitioner, config_options, log_level,
+                           ipprefix=allocation.ipprefix, prepare=allocation.assign_ports)
+
+        TEMPLATE_POOL.clone(key, name, self.test_path, builder)
+        debug("cloned cluster template {} (pool hits: {}, misses: {})".format(key, TEMPLATE_POOL.hits, TEMPLATE_POOL.misses))
+
+        # adopt the cloned nodes and rewrite their per-test configuration
+        # (data/commitlog paths, log location) for the new directory
+        loaded = ClusterFactory.load(self.test_path, name)
+        cluster.nodes = loaded.nodes
+        cluster.seeds = loaded.seeds
+        if hasattr(loaded, 'use_vnodes'):
+            cluster.use_vnodes = loaded.use_vnodes
+        for node in cluster.nodelist():
+            node.cluster = cluster
+            node.import_config_files()
+        cluster._update_config()
+
+    @PROFILER.timed('cleanup')
     def _cleanup_cluster(self):
-        if KEEP_TEST_DIR:
-            self.cluster.stop(gently=RECORD_COVERAGE)
-        else:
-            # when recording coverage the jvm has to exit normally
-            # or the coverage information is not written by the jacoco agent
-            # otherwise we can just kill the process
-            if RECORD_COVERAGE:
-                self.cluster.stop(gently=True)
-
-            # Cleanup everything:
-            debug("removing ccm cluster " + self.cluster.name + " at: " + self.test_path)
-            self.cluster.remove()
-            os.rmdir(self.test_path)
-        if os.path.exists(LAST_TEST_DIR):
-            os.remove(LAST_TEST_DIR)
+        # when recording coverage the jvm has to exit normally
+        # or the coverage information is not written by the jacoco agent
+        # otherwise we can just kill the process.
+        # The reaper stops and removes the cluster in the background, unless
+        # SYNC_TEARDOWN is set; the next populate waits for the nodes to be gone.
+        REUSE_SCHEDULER.forget(self.test_path)
+        cluster_reaper().reap(self.cluster, self.test_path, remove=not KEEP_TEST_DIR,
+                              gently=RECORD_COVERAGE, sync=SYNC_TEARDOWN, after=PLACEMENT.release)
 
     def set_node_to_current_version(self, node):
         version = os.environ.get('CASSANDRA_VERSION')
@@ -181,50 +580,202 @@ class Tester(TestCase):
     def setUp(self):
         global CURRENT_TEST
         CURRENT_TEST = self.id() + self._testMethodName
-        # cleaning up if a previous execution didn't trigger tearDown (which
-        # can happen if it is interrupted by KeyboardInterrupt)
+        # the @since, @no_vnodes and @require checks of the test, so that a
+        # skipped test never gets as far as creating a cluster
+        for check in getattr(getattr(self, self._testMethodName), 'skip_checks', ()):
+            reason = check(installed_cassandra_version())
+            if reason:
+                self.skip(reason)
+        PROFILER.begin(self.id())
+        # cleaning up if a previous execution didn't trigger tearDown, and
+        # picking up the cluster of the previous test if it was preserved
         # TODO: move that part to a generic fixture
-        if os.path.exists(LAST_TEST_DIR):
-            with open(LAST_TEST_DIR) as f:
-                self.test_path = f.readline().strip('\n')
-                name = f.readline()
-            try:
-                self.cluster = ClusterFactory.load(self.test_path, name)
-                # Avoid waiting too long for node to be marked down
-                if not self._preserve_cluster:
-                    self._cleanup_cluster()
-            except IOError:
-                # after a restart, /tmp will be emptied so we'll get an IOError when loading the old cluster here
-                pass
+        kept = reclaim_leftover_clusters(keep_last=self._preserve_cluster)
+        if kept is not None:
+            self.test_path, self.cluster = kept
+
+        self.__configure_cluster()
+        self.connections = []
+        self.connection_cache = ConnectionCache()
+        self.nodes_in_ram = []
+        self.node_start_times = {}
+        self.start_time = time.time()
+        self.runners = []
+        self._defer_schema_agreement = False
+        PROFILER.switch('test')
 
+    def __node_profile(self):
+        name = NODE_PROFILE or self.node_profile
+        if not name or name == 'none':
+            return None, None
+        return name, get_profile(name)
+
+    def __configure_cluster(self):
         self.cluster = self._get_cluster()
+        profile = self.__node_profile()[1]
+        if profile is not None:
+            os.environ.update(profile.environment())
         if RECORD_COVERAGE:
             self.__setup_jacoco()
-        # the failure detector can be quite slow in such tests with quick start/stop
-        self.cluster.set_configuration_options(values={'phi_convict_threshold': 5})
+        self.cluster.set_configuration_options(values=self.__cluster_options())
 
+        journal = cluster_reaper().journal
+        if self.test_path not in dict(journal.pending()):
+            journal.created(self.test_path, self.cluster.name)
+        if DEBUG:
+            self.cluster.set_log_level("DEBUG")
+        if TRACE:
+            self.cluster.set_log_level("TRACE")
+
+    def __cluster_options(self, extra=None):
+        # the failure detector can be quite slow in such tests with quick start/stop
+        options = {'phi_convict_threshold': 5}
+        profile = self.__node_profile()[1]
+        if profile is not None:
+            options.update(profile.config_options(installed_cassandra_version()))
         timeout = 10000
         if self.cluster_options is not None:
-            self.cluster.set_configuration_options(values=self.cluster_options)
+            options.update(self.cluster_options)
         else:
-            self.cluster.set_configuration_options(values={
+            options.update({
                 'read_request_timeout_in_ms' : timeout,
                 'range_request_timeout_in_ms' : timeout,
                 'write_request_timeout_in_ms' : timeout,
                 'truncate_request_timeout_in_ms' : timeout,
                 'request_timeout_in_ms' : timeout
             })
+        if extra:
+            options.update(extra)
+        return options
 
-        with open(LAST_TEST_DIR, 'w') as f:
-            f.write(self.test_path + '\n')
-            f.write(self.cluster.name)
-        if DEBUG:
-            self.cluster.set_log_level("DEBUG")
-        if TRACE:
-            self.cluster.set_log_level("TRACE")
-        self.connections = []
-        self.runners = []
+    def prepare_cluster(self, nodes=1, partitioner=None, config_options=None):
+        """
+        Populates and starts self.cluster with nodes, partitioner and
+        config_options, and returns it.
+
+        In a @canReuseCluster class run with REUSE_CLUSTER, the running
+        cluster of the previous test is returned instead if it was started
+        with the same requirements, once the keyspaces created since its start
+        have been dropped. A cluster that does not match, is down or cannot be
+        reset is replaced by a fresh one.
+        """
+        key = template_key(installed_cassandra_version(), nodes, partitioner,
+                           self.__cluster_options(config_options), None)
+        if self.cluster.nodelist():
+            started = REUSE_SCHEDULER.lookup(self.test_path)
+            if self._preserve_cluster and started is not None and started[0] == key \
+                    and self.__reset_cluster(started[1]):
+                REUSE_SCHEDULER.reused()
+                debug("reusing the cluster at {}".format(self.test_path))
+                return self.cluster
+            if self._preserve_cluster:
+                debug("replacing the cluster at {}, which does not fit this test".format(self.test_path))
+                REUSE_SCHEDULER.replaced()
+            self._cleanup_cluster()
+            del self.cluster
+            self.__configure_cluster()
+
+        if partitioner:
+            self.cluster.set_partitioner(partitioner)
+        if config_options:
+            self.cluster.set_configuration_options(values=config_options)
+        self.cluster.populate(nodes)
+        self.start_cluster(wait_for='gossip' if nodes > 1 else 'native')
+        if self._preserve_cluster:
+            session = self.patient_cql_connection(self.cluster.nodelist()[0])
+            REUSE_SCHEDULER.started(self.test_path, key, self.__keyspaces(session))
+        return self.cluster
+
+    def __keyspaces(self, session):
+        table = 'system_schema.keyspaces' if self.cluster.version() >= '3.0' else 'system.schema_keyspaces'
+        return set(row[0] for row in session.execute('SELECT keyspace_name FROM ' + table))
+
+    def __reset_cluster(self, keyspaces):
+        """
+        Drops every keyspace that is not in keyspaces, the set present when
+        the cluster started, and checks that only those are left. Returns
+        False if the cluster cannot be reused.
+        """
+        nodes = self.cluster.nodelist()
+        if not all(node.is_running() and port_is_open(*self.get_client_interface(node)) for node in nodes):
+            return False
+        try:
+            session = self.patient_cql_connection(nodes[0])
+            for keyspace in self.__keyspaces(session) - keyspaces:
+                session.execute('DROP KEYSPACE "%s"' % keyspace)
+            self.wait_for_schema_agreement(session)
+            remaining = self.__keyspaces(session)
+        except Exception as e:
+            debug("could not reset the cluster at {}: {}".format(self.test_path, e))
+            return False
+        return remaining == keyspaces
 
+    @PROFILER.timed('cluster_start')
+    def start_cluster(self, wait_for='native', timeout=120, jvm_args=None):
+        """
+        Starts every stopped node of the populated cluster concurrently and
+        returns once they are ready, instead of waiting on each node's log.
+
+        The seeds are launched first and the other nodes as soon as the seeds
+        accept gossip connections. wait_for decides when a node is ready:
+            'native' - it accepts connections on its native (or thrift) port
+            'gossip' - as above, and every node sees all the others as UP
+            'schema' - as above, and all nodes agree on the schema version
+        """
+        if wait_for not in ('native', 'gossip', 'schema'):
+            raise ValueError("wait_for must be one of 'native', 'gossip' or 'schema', got %s" % wait_for)
+        start = time.time()
+        deadline = start + (timeout * 5 if is_win() else timeout)
+
+        to_start = [node for node in self.cluster.nodelist() if not node.is_running()]
+        seed_addresses = self.cluster.get_seeds()
+        seeds = [node for node in to_start if node.network_interfaces['storage'][0] in seed_addresses]
+        others = [node for node in to_start if node not in seeds]
+
+        launched = dict((node.name, time.time()) for node in seeds)
+        self.__launch_nodes(seeds, jvm_args)
+        for node in seeds:
+            self.__wait_for_port(node, node.network_interfaces['storage'], deadline)
+        launched.update((node.name, time.time()) for node in others)
+        self.__launch_nodes(others, jvm_args)
+        for node in to_start:
+            self.__wait_for_port(node, self.get_client_interface(node), deadline)
+            self.node_start_times[node.name] = time.time() - launched[node.name]
+
+        if wait_for in ('gossip', 'schema'):
+            wait_until(all_nodes_up(self.cluster.nodelist()), timeout=max(deadline - time.time(), 0))
+        if wait_for == 'schema':
+            self.wait_for_schema_agreement(timeout=max(deadline - time.time(), 0))
+        debug("started {} nodes, ready for {} after {:.2f}s".format(len(to_start), wait_for, time.time() - start))
+        return self.cluster
+
+    def __launch_nodes(self, nodes, jvm_args):
+        errors = []
+
+        def launch(node):
+            try:
+                node.start(jvm_args=jvm_args or [])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=launch, args=(node,)) for node in nodes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def __wait_for_port(self, node, interface, deadline):
+        address, port = interface
+        while not port_is_open(address, port):
+            if not node.is_running():
+                raise RuntimeError("%s exited during startup, see %s" % (node.name, node.logfilename()))
+            if time.time() > deadline:
+                raise RuntimeError("%s did not start listening on %s:%s in time" % (node.name, address, port))
+            time.sleep(0.1)
+
+    @PROFILER.timed('copy_logs')
     def copy_logs(self, directory=None, name=None):
         """Copy the current cluster's log files somewhere, by default to LOG_SAVED_DIR with a name of 'last'"""
         if directory is None:
@@ -238,6 +789,9 @@ class Tester(TestCase):
         logs = [ (node.name, node.logfilename()) for node in self.cluster.nodes.values() ]
         if len(logs) is not 0:
             basedir = str(int(time.time() * 1000)) + '_' + self.id()
+            if ARCHIVE_LOGS:
+                self.__archive_logs(directory, basedir, name)
+                return
             logdir = os.path.join(directory, basedir)
             os.mkdir(logdir)
             for n, log in logs:
@@ -247,34 +801,71 @@ class Tester(TestCase):
             if not is_win():
                 os.symlink(basedir, name)
 
+    def __archive_logs(self, directory, basedir, name):
+        """
+        Queues a <basedir>.tar.gz archive of the node logs, and of the
+        ARCHIVE_EXTRAS (gc, threads, sstables), for the background archiver.
+        Only what has to be captured while the cluster still exists is done
+        synchronously.
+        """
+        files = []
+        extras = []
+        for node in self.cluster.nodelist():
+            files.append((os.path.join(node.name, 'system.log'), node.logfilename()))
+            logs_dir = os.path.dirname(node.logfilename())
+            if 'gc' in ARCHIVE_EXTRAS and os.path.isdir(logs_dir):
+                for f in sorted(os.listdir(logs_dir)):
+                    if f.startswith('gc'):
+                        files.append((os.path.join(node.name, f), os.path.join(logs_dir, f)))
+            if 'threads' in ARCHIVE_EXTRAS and node.is_running():
+                extras.append((os.path.join(node.name, 'threads.txt'), self.__thread_dump(node)))
+            if 'sstables' in ARCHIVE_EXTRAS:
+                extras.append((os.path.join(node.name, 'sstables.txt'), self.__sstable_listing(node)))
+
+        archive = basedir + '.tar.gz'
+        staging_dir = os.path.join(directory, '.staging_' + basedir)
+        staged = LOG_ARCHIVER.stage(staging_dir, files)
+        LOG_ARCHIVER.submit(os.path.join(directory, archive), staging_dir, staged, extras)
+        if os.path.lexists(name):
+            os.unlink(name)
+        if not is_win():
+            os.symlink(archive, name)
+
+    def __thread_dump(self, node):
+        java_home = os.environ.get('JAVA_HOME')
+        jstack = os.path.join(java_home, 'bin', 'jstack') if java_home else 'jstack'
+        try:
+            return subprocess.check_output([jstack, str(node.pid)], stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError) as e:
+            return "jstack failed: %s\n" % e
+
+    def __sstable_listing(self, node):
+        data_dir = os.path.join(node.get_path(), 'data')
+        lines = []
+        for dirpath, dirnames, filenames in os.walk(data_dir):
+            for f in sorted(filenames):
+                path = os.path.join(dirpath, f)
+                try:
+                    lines.append("%12d %s" % (os.path.getsize(path), os.path.relpath(path, data_dir)))
+                except OSError:
+                    # removed by a compaction in the meantime
+                    pass
+        return '\n'.join(lines) + '\n'
+
     def cql_connection(self, node, keyspace=None, version=None, user=None,
         password=None, compression=True, protocol_version=None):
 
-        node_ip = self.get_ip_from_node(node)
-
-        if protocol_version is None:
-            if self.cluster.version() >= '2.1':
-                protocol_version = 3
-            elif self.cluster.version() >= '2.0':
-                protocol_version = 2
-            else:
-                protocol_version = 1
-
-        if user is None:
-            cluster = PyCluster([node_ip], compression=compression, protocol_version=protocol_version)
-        else:
-            auth_provider=self.get_auth_provider(user=user, password=password)
-            cluster = PyCluster([node_ip], auth_provider=auth_provider, compression=compression, protocol_version=protocol_version)
-        session = cluster.connect()
-        if keyspace is not None:
-            session.execute('USE %s' % keyspace)
-
-        self.connections.append(session)
-        return session
+        return self._connect(node, keyspace=keyspace, user=user, password=password,
+                             compression=compression, protocol_version=protocol_version)
 
     def exclusive_cql_connection(self, node, keyspace=None, version=None,
         user=None, password=None, compression=True, protocol_version=None):
 
+        return self._connect(node, keyspace=keyspace, user=user, password=password,
+                             compression=compression, protocol_version=protocol_version, exclusive=True)
+
+    @PROFILER.timed('connect')
+    def _connect(self, node, keyspace, user, password, compression, protocol_version, exclusive=False):
         node_ip = self.get_ip_from_node(node)
 
         if protocol_version is None:
@@ -285,16 +876,16 @@ class Tester(TestCase):
             else:
                 protocol_version = 1
 
-        wlrr = WhiteListRoundRobinPolicy([node_ip])
-        if user is None:
-            cluster = PyCluster([node_ip], compression=compression, protocol_version=protocol_version, load_balancing_policy=wlrr)
-        else:
-            auth_provider=self.get_auth_provider(user=user, password=password)
-            cluster = PyCluster([node_ip], auth_provider=auth_provider, compression=compression, protocol_version=protocol_version, load_balancing_policy=wlrr)
-        session = cluster.connect()
-        if keyspace is not None:
-            session.execute('USE %s' % keyspace)
+        def new_cluster():
+            kwargs = {'compression': compression, 'protocol_version': protocol_version}
+            if exclusive:
+                kwargs['load_balancing_policy'] = WhiteListRoundRobinPolicy([node_ip])
+            if user is not None:
+                kwargs['auth_provider'] = self.get_auth_provider(user=user, password=password)
+            return PyCluster([node_ip], **kwargs)
 
+        key = (node.name, user, password, protocol_version, compression, exclusive)
+        session = self.connection_cache.session(node, key, keyspace, new_cluster)
         self.connections.append(session)
         return session
 
@@ -356,6 +947,7 @@ class Tester(TestCase):
             # we assume networkTopolyStrategy
             options = (', ').join([ '\'%s\':%d' % (d, r) for d, r in rf.iteritems() ])
             session.execute(query % (name, "'class':'NetworkTopologyStrategy', %s" % options))
+        self.wait_for_schema_agreement(session)
         session.execute('USE %s' % name)
 
     # We default to UTF8Type because it's simpler to use in tests
@@ -381,34 +973,76 @@ class Tester(TestCase):
                 query = '%s AND speculative_retry=\'%s\'' % (query, speculative_retry)
 
         session.execute(query)
-        time.sleep(0.2)
+        self.wait_for_schema_agreement(session)
+
+    def execute_ddl(self, session, statements, timeout=60):
+        """
+        Executes several schema statements in order and waits for schema
+        agreement once, after the last one, instead of after each of them.
+        """
+        with self.deferred_schema_agreement(session):
+            for statement in statements:
+                session.execute(statement)
+        self.wait_for_schema_agreement(session, timeout=timeout)
+
+    @contextmanager
+    def deferred_schema_agreement(self, session):
+        """
+        Within this block create_ks, create_cf and wait_for_schema_agreement
+        return without waiting, and the driver does not wait for agreement
+        after each schema statement either. Call wait_for_schema_agreement
+        once at the end of the block.
+        """
+        previous = (self._defer_schema_agreement, session.cluster.max_schema_agreement_wait)
+        self._defer_schema_agreement = True
+        session.cluster.max_schema_agreement_wait = 0
+        try:
+            yield
+        finally:
+            self._defer_schema_agreement, session.cluster.max_schema_agreement_wait = previous
+
+    @PROFILER.timed('schema_agreement')
+    def wait_for_schema_agreement(self, session=None, timeout=60):
+        """
+        Blocks until the nodes that the driver of session sees as up report
+        the same schema version, using the driver's own check of
+        system.local and system.peers, which ignores peers that do not know
+        their schema version yet.
+
+        Without a session, a connection to the first node accepting clients
+        is used. Raises RuntimeError if the schema has not converged after
+        timeout seconds.
+        """
+        if self._defer_schema_agreement:
+            return
+        nodes = _running(self.cluster.nodelist())
+        if len(nodes) <= 1:
+            # a single node applies schema changes before acknowledging them
+            return
+        if session is None:
+            nodes = [node for node in nodes if port_is_open(*self.get_client_interface(node))]
+            if not nodes:
+                raise RuntimeError("no node accepts clients to check the schema agreement")
+            session = self.patient_cql_connection(nodes[0])
+        control_connection = session.cluster.control_connection
+        # each call waits up to the cluster's max_schema_agreement_wait
+        wait_until(control_connection.wait_for_schema_agreement, timeout=timeout, interval=0.1)
 
 
     @classmethod
     def tearDownClass(cls):
         reset_environment_vars()
-        if os.path.exists(LAST_TEST_DIR):
-            with open(LAST_TEST_DIR) as f:
-                test_path = f.readline().strip('\n')
-                name = f.readline()
-                try:
-                    cluster = ClusterFactory.load(test_path, name)
-                    # Avoid waiting too long for node to be marked down
-                    if KEEP_TEST_DIR:
-                        cluster.stop(gently=RECORD_COVERAGE)
-                    else:
-                        cluster.remove()
-                        os.rmdir(test_path)
-                    os.remove(LAST_TEST_DIR)
-                except IOError:
-                    # after a restart, /tmp will be emptied so we'll get an IOError when loading the old cluster here
-                    pass
+        reclaim_leftover_clusters()
 
     def tearDown(self):
+        PROFILER.switch('tearDown')
         reset_environment_vars()
 
         for con in self.connections:
             con.shutdown()
+        cache = self.connection_cache
+        debug("connection cache: {} hits, {} misses, {} reconnects".format(cache.hits, cache.misses, cache.reconnects))
+        cache.shutdown()
 
         for runner in self.runners:
             try:
@@ -418,13 +1052,25 @@ class Tester(TestCase):
 
         failed = sys.exc_info() != (None, None, None)
         try:
-            for node in self.cluster.nodelist():
-                if self.allow_log_errors == False:
-                    errors = list(self.__filter_errors([ msg for msg, i in node.grep_log("ERROR")]))
+            if self.allow_log_errors == False:
+                for node, errors in self.__scan_log_errors():
+                    errors = list(self.__filter_errors(errors))
                     if len(errors) is not 0:
                         failed = True
                         raise AssertionError('Unexpected error in %s node log: %s' % (node.name, errors))
+            else:
+                for node in self.cluster.nodelist():
+                    LOG_SCANNER.skip(node.logfilename())
         finally:
+            try:
+                if TMPFS_CLUSTERS and not failed:
+                    self.__record_footprint()
+            except Exception as e:
+                print "Error recording cluster footprint:", str(e)
+            try:
+                self.__record_node_stats()
+            except Exception as e:
+                print "Error recording node statistics:", str(e)
             try:
                 if failed or KEEP_LOGS:
                     # means the test failed. Save the logs for inspection.
@@ -436,6 +1082,37 @@ class Tester(TestCase):
                     self._cleanup_cluster()
                 elif self._preserve_cluster and failed:
                     self._cleanup_cluster()
+                PROFILER.end('failed' if failed else 'passed')
+
+    def __record_node_stats(self):
+        """
+        Logs and records in logs/node_stats.jsonl how long the nodes started
+        by start_cluster took to accept clients, and their memory use.
+        """
+        nodes = [(node.name, self.node_start_times.get(node.name), node.pid)
+                 for node in self.cluster.nodelist() if node.is_running()]
+        if not nodes:
+            return
+        stats = record_node_stats(os.path.join(LOG_SAVED_DIR, 'node_stats.jsonl'), self.id(), self.__node_profile()[0], nodes)
+        for name, node_stats in sorted(stats.items()):
+            debug("{}: started in {}s, rss {} bytes (peak {})".format(
+                name, node_stats['start_seconds'], node_stats['rss'], node_stats['peak_rss']))
+
+    def __record_footprint(self):
+        """
+        Records the per-node footprint and duration of this test, and reports
+        how much faster it was in RAM than its previous runs on disk.
+        """
+        nodes = self.cluster.nodelist()
+        if not nodes:
+            return
+        footprint = max(sum(directory_size(os.path.join(node.get_path(), d)) for d in NODE_SUBDIRS) for node in nodes)
+        in_ram = len(self.nodes_in_ram) == len(nodes)
+        duration = time.time() - self.start_time
+        entry = PLACEMENT.history.record(self.id(), footprint, duration, in_ram)
+        if in_ram and entry.get('disk_runs'):
+            debug("RAM placement saved {:.2f}s compared to the average disk run ({} MB per node)".format(
+                entry['disk_duration'] - duration, footprint / (1024 * 1024)))
 
     def go(self, func):
         runner = Runner(func)
@@ -471,23 +1148,42 @@ class Tester(TestCase):
         else:
             debug("Jacoco agent not found or is not file. Execution will not be recorded.")
 
+    @PROFILER.timed('log_scan')
+    def __scan_log_errors(self):
+        """Returns (node, error lines) for every node, scanning the logs in parallel"""
+        nodes = self.cluster.nodelist()
+        results = [[] for node in nodes]
+
+        def scan(i, node):
+            results[i] = LOG_SCANNER.scan(node.logfilename())
+
+        threads = [threading.Thread(target=scan, args=(i, node)) for i, node in enumerate(nodes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return zip(nodes, results)
+
     def __filter_errors(self, errors):
         """Filter errors, removing those that match self.ignore_log_patterns"""
         if not hasattr(self, 'ignore_log_patterns'):
             self.ignore_log_patterns = []
+        if not self.ignore_log_patterns:
+            for e in errors:
+                yield e
+            return
+        ignored = re.compile('|'.join('(?:%s)' % pattern for pattern in self.ignore_log_patterns))
         for e in errors:
-            for pattern in self.ignore_log_patterns:
-                if re.search(pattern, e):
-                    break
-            else:
+            if not ignored.search(e):
                 yield e
 
     def get_ip_from_node(self, node):
+        return self.get_client_interface(node)[0]
+
+    def get_client_interface(self, node):
         if node.network_interfaces['binary']:
-            node_ip = node.network_interfaces['binary'][0]
-        else:
-            node_ip = node.network_interfaces['thrift'][0]
-        return node_ip
+            return node.network_interfaces['binary']
+        return node.network_interfaces['thrift']
 
     def get_auth_provider(self, user, password):
         if self.cluster.version() >= '2.0':
@@ -525,6 +1221,7 @@ class freshCluster():
             f(obj)
         wrapped.__name__ = f.__name__
         wrapped.__doc__ = f.__doc__
+        wrapped.skip_checks = getattr(f, 'skip_checks', [])
         return wrapped
 
 
@@ -47,46 +47,52 @@ class TestGlobalRowKeyCache(Tester):
                 self.create_ks(cursor, ks_name, 3)
                 time.sleep(1) # wait for propagation
 
-                host, port = node1.network_interfaces['thrift']
+                host, port = node1.network_interfaces['binary']
 
                 # create some load makers
-                lm_standard = LoadMaker(host, port,
-                        keyspace_name=ks_name, column_family_type='standard')
-                lm_counter = LoadMaker(host, port,
-                        keyspace_name=ks_name, column_family_type='standard', is_counter=True)
-
-                # insert some rows
-                lm_standard.generate(NUM_INSERTS)
-                lm_counter.generate(NUM_INSERTS)
-
-                # flush everything to get it into sstables
-                for node in cluster.nodelist():
-                    node.flush()
-
-                debug("Validating")
-                for i in range(3):
-                    # read and modify multiple times to get data into and invalidated out of the cache.
-                    lm_standard.update(NUM_UPDATES).delete(NUM_DELETES).validate()
-                    lm_counter.generate().validate()
-
-                # let the data be written to the row/key caches.
-                debug("Letting caches be written")
-                time.sleep(10)
-                debug("Stopping cluster")
-                cluster.stop()
-                time.sleep(1)
-                debug("Starting cluster")
-                cluster.start()
-                time.sleep(5) # read the data back from row and key caches
-
-                lm_standard.refresh_connection()
-                lm_counter.refresh_connection()
-
-                debug("Validating again...")
-                for i in range(2):
-                    # read and modify multiple times to get data into and invalidated out of the cache.
-                    lm_standard.validate()
-                    lm_counter.validate()
-
-
+                load_makers = []
+                try:
+                    lm_standard = LoadMaker(host, port,
+                            keyspace_name=ks_name, column_family_type='standard')
+                    load_makers.append(lm_standard)
+                    lm_counter = LoadMaker(host, port,
+                            keyspace_name=ks_name, column_family_type='standard', is_counter=True)
+                    load_makers.append(lm_counter)
+
+                    # insert some rows
+                    lm_standard.generate(NUM_INSERTS)
+                    lm_counter.generate(NUM_INSERTS)
+
+                    # flush everything to get it into sstables
+                    for node in cluster.nodelist():
+                        node.flush()
+
+                    debug("Validating")
+                    for i in range(3):
+                        # read and modify multiple times to get data into and invalidated out of the cache.
+                        lm_standard.update(NUM_UPDATES).delete(NUM_DELETES).validate()
+                        lm_counter.generate().validate()
+
+                    # let the data be written to the row/key caches.
+                    debug("Letting caches be written")
+                    time.sleep(10)
+                    debug("Stopping cluster")
+                    cluster.stop()
+                    time.sleep(1)
+                    debug("Starting cluster")
+                    cluster.start()
+                    time.sleep(5) # read the data back from row and key caches
+
+                    lm_standard.refresh_connection()
+                    lm_counter.refresh_connection()
+
+                    debug("Validating again...")
+                    for i in range(2):
+                        # read and modify multiple times to get data into and invalidated out of the cache.
+                        lm_standard.validate()
+                        lm_counter.validate()
+                finally:
+                    # the load makers' driver clusters must not outlive a failed check
+                    for load_maker in load_makers:
+                        load_maker.shutdown()
                 cluster.stop()
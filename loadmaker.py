@@ -12,12 +12,13 @@ import time
 import uuid
 import pprint
 import threading
-import cql
+import collections
 
-try:
-    import cStringIO as StringIO
-except ImportError:
-    import StringIO
+from cassandra import ConsistencyLevel, AlreadyExists, OperationTimedOut
+from cassandra.cluster import Cluster, NoHostAvailable
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.policies import TokenAwarePolicy, RoundRobinPolicy
+from data_generator import DataGenerator
 
 
 class LoadMaker(object):
@@ -28,10 +29,15 @@ class LoadMaker(object):
 
     Defaults are provided in _DEFAULTS, and each can be overwritten
     by passing parameters with the same name to the constructor.
+
+    Rows are stored in a table with one CQL row per column
+    (key, column1, value), written and read through prepared statements
+    that the driver routes to a replica of their key. Each operation runs its
+    statements through execute_concurrent, at most concurrency at a time.
     """
 
     _DEFAULTS = {
-        'keyspace_name': 'Keyspace_lm',
+        'keyspace_name': 'keyspace_lm',
         'replication_factor': '3',
 
         'is_counter': False,
@@ -47,7 +53,7 @@ class LoadMaker(object):
     }
 
 
-    def __init__(self, host='localhost', port=9160, create_ks=True, create_cf=True, **kwargs):
+    def __init__(self, host='localhost', port=9042, create_ks=True, create_cf=True, concurrency=64, **kwargs):
 
         # allow for overwriting any of the defaults
         self._params = LoadMaker._DEFAULTS.copy()
@@ -68,8 +74,12 @@ class LoadMaker(object):
 
         # column_family_type should be lowercase so that future comparisons will work.
         self._params['column_family_type'] = self._params['column_family_type'].lower()
+        # the keyspace is created unquoted, which cassandra stores lowercase,
+        # while set_keyspace quotes the name it is given
+        self._params['keyspace_name'] = self._params['keyspace_name'].lower()
 
         self._num_generate_calls = 0
+        self._data = DataGenerator(seed=0, table=self._params['column_family_name'])
 
         # Keys are in a sort of ever-growing queue. They are inserted at the
         # end of high indexes, and updated and deleted from low indexes.
@@ -81,14 +91,20 @@ class LoadMaker(object):
         # time each DB operationan and return the last one. Only times,
         # as much as possible, the DB portion of the operation.
         self.last_operation_time = 0
-
+        # statements, seconds, throughput and mean latency of the last operation
+        self.last_operation_stats = None
+
+        self._concurrency = concurrency
+        self._consistency_level = ConsistencyLevel.name_to_value[self._params['consistency_level'].upper()]
+        self._cluster = None
+        self._session = None
+        self._prepared = {}
         self._is_keyspace_created = False
         self.refresh_connection(host, port)
         if create_ks:
-            self.create_keyspace(self._cursor)
+            self.create_keyspace()
         self._is_keyspace_created = True
-        cql_str = "USE %s" % self._params['keyspace_name']
-        self.execute_query(cql_str)
+        self._session.set_keyspace(self._params['keyspace_name'])
 
         if create_cf:
             self.create_column_family()
@@ -96,21 +112,11 @@ class LoadMaker(object):
             # Now find the value that the counters should have. They should all have the same value.
             row_key = self._generate_row_key(0)
             col_name = self._generate_col_name(0)
-            cql_str = "SELECT '%s' FROM %s WHERE KEY='%s'"%(
-                    col_name, self._params['column_family_name'], row_key)
-            self.execute_query(cql_str)
-            from_db = self._cursor.fetchone()
-            self._num_generate_calls = from_db[0] or 0
+            rows = self._session.execute(self._prepare('read_cell'), (row_key, col_name))
+            self._num_generate_calls = rows[0][0] if rows else 0
 
-    
-    @property
-    def _cursor(self):
-        if self._cached_cursor == None:
-            self.refresh_connection()
-        return self._cached_cursor
-                
 
-    def refresh_connection(self, host=None, port=None, cql_version="2.0.0", num_retries=10):
+    def refresh_connection(self, host=None, port=None, num_retries=10):
         """
         establish a connection to the server. retry if needed.
         """
@@ -118,23 +124,29 @@ class LoadMaker(object):
             self._host = host
         if port:
             self._port = port
-        self._cql_version = cql_version or None
-            
+        if self._cluster is not None:
+            self._cluster.shutdown()
+        self._prepared = {}
+
         for try_num in xrange(1+num_retries):
             try:
-                if self._cql_version:
-                    con = cql.connect(self._host, self._port, keyspace=None, cql_version=self._cql_version)
-                else:
-                    con = cql.connect(self._host, self._port, keyspace=None)
-                self._cached_cursor = con.cursor()
+                self._cluster = Cluster([self._host], port=self._port,
+                                        load_balancing_policy=TokenAwarePolicy(RoundRobinPolicy()))
+                self._session = self._cluster.connect()
                 if self._is_keyspace_created:
-                    cql_str = "USE %s" % self._params['keyspace_name']
-                    self.execute_query(cql_str)
-            except:
+                    self._session.set_keyspace(self._params['keyspace_name'])
+            except NoHostAvailable:
                 if try_num < num_retries:
                     time.sleep(1)
                 else:
                     raise
+            else:
+                break
+
+
+    def shutdown(self):
+        if self._cluster is not None:
+            self._cluster.shutdown()
 
 
     def __str__(self):
@@ -150,23 +162,67 @@ class LoadMaker(object):
             '_num_generate_calls': self._num_generate_calls,
         }.items()))
         return "LoadMaker<" + str(params) + ">"
-    
-    
+
+
+    def _prepare(self, name):
+        """
+        Returns the prepared statement called name, preparing it on first use.
+        """
+        if name not in self._prepared:
+            cf_name = self._params['column_family_name']
+            cql_str = {
+                'insert': "INSERT INTO %s (key, column1, value) VALUES (?, ?, ?)",
+                'increment': "UPDATE %s SET value = value + 1 WHERE key = ? AND column1 = ?",
+                'delete_cell': "DELETE FROM %s WHERE key = ? AND column1 = ?",
+                'delete_row': "DELETE FROM %s WHERE key = ?",
+                'read_row': "SELECT column1, value FROM %s WHERE key = ?",
+                'read_cell': "SELECT value FROM %s WHERE key = ? AND column1 = ?",
+            }[name] % cf_name
+            statement = self._session.prepare(cql_str)
+            statement.consistency_level = self._consistency_level
+            self._prepared[name] = statement
+        return self._prepared[name]
+
+
+    def _execute_concurrent(self, operation, name, parameters):
+        """
+        Executes the prepared statement called name once for each item of
+        parameters, keeping up to self._concurrency of them in flight, and
+        returns their results in order. The throughput and mean latency of
+        the whole call are logged and kept in last_operation_stats.
+        """
+        statement = self._prepare(name)
+        parameters = list(parameters)
+        start = time.time()
+        results = execute_concurrent_with_args(self._session, statement, parameters,
+                                               concurrency=self._concurrency)
+        elapsed = time.time() - start
+        for success, result in results:
+            if not success:
+                raise result
+        self.last_operation_time = elapsed
+        count = len(parameters)
+        # with the window kept full, each statement spends in flight about
+        # window / throughput (Little's law)
+        throughput = count / elapsed if elapsed > 0 else 0
+        in_flight = min(self._concurrency, count)
+        self.last_operation_stats = {
+            'operation': operation,
+            'statements': count,
+            'seconds': elapsed,
+            'ops_per_second': throughput,
+            'mean_latency': in_flight / throughput if throughput else 0,
+        }
+        debug("%s: %d statements in %.3fs (%.0f ops/s, ~%.1fms mean latency)" % (
+            operation, count, elapsed, throughput, self.last_operation_stats['mean_latency'] * 1000))
+        return [result for success, result in results]
+
+
     def batch_insert(self, rows):
-        cql_stream = StringIO.StringIO()
-        cql_stream.write("BEGIN BATCH USING CONSISTENCY %s\n" % self._params['consistency_level'])
-        for key, col_dict in rows.items():
-            col_names = col_dict.keys()
-            columns = ', '.join("'"+str(a)+"'" for a in col_names)
-            values = ', '.join("'"+str(col_dict[a])+"'" for a in col_names)
-            cql_stream.write("INSERT INTO %s (KEY, %s) VALUES ('%s', %s);\n" % (
-                    self._params['column_family_name'],
-                    columns,
-                    key,
-                    values,
-                    ))
-        cql_stream.write("APPLY BATCH;")
-        self.execute_query(cql_stream.getvalue())
+        cells = [(key, col_name, value)
+                 for key, col_dict in rows.items()
+                 for col_name, value in col_dict.items()]
+        self._execute_concurrent('insert', 'insert', cells)
 
 
     def generate(self, num_keys=10000):
@@ -175,7 +231,7 @@ class LoadMaker(object):
         """
         debug("Generate() starting " + str(self))
         new_inserted_key_count = self._inserted_key_count + num_keys
-        
+
         if self._params['is_counter']:
             self._generate_counter()
         else:
@@ -191,14 +247,15 @@ class LoadMaker(object):
 
     def update(self, num_keys=1000):
         """
-        Update some keys that were previously inserted.
+        Update some keys that were previously inserted. Not supported for
+        counters, whose values all have to move together.
         """
         saved_updated_key_count = self._updated_key_count
         self._updated_key_count += num_keys
         assert self._updated_key_count <= self._inserted_key_count, "You have to generate() more then you update()!"
 
         if self._params['is_counter']:
-            raise NotImplemented("Counter updates have not been implemented yet.")
+            raise NotImplementedError("Counter updates have not been implemented yet.")
         else:
             rows = self._gen_rows(saved_updated_key_count, self._updated_key_count)
             # do the update
@@ -206,10 +263,8 @@ class LoadMaker(object):
             debug("update() inserted %d rows" % len(rows))
 
             # remove the first column from each row
-            for row_key in rows.keys():
-                col_name = self._generate_col_name(0)
-                cql_str = "DELETE '%s' FROM %s WHERE KEY='%s'"%(col_name, self._params['column_family_name'], row_key)
-                self.execute_query(cql_str)
+            col_name = self._generate_col_name(0)
+            self._execute_concurrent('update', 'delete_cell', [(row_key, col_name) for row_key in rows.keys()])
 
         return self
 
@@ -223,27 +278,20 @@ class LoadMaker(object):
         assert self._deleted_key_count <= self._updated_key_count, "You have to update() more then you delete()!"
 
         row_keys = [self._generate_row_key(i) for i in xrange(saved_deleted_key_count, self._deleted_key_count)]
-        for row_key in row_keys:
-            cql_str = "DELETE FROM %s WHERE KEY='%s'"%(self._params['column_family_name'], row_key)
-            self.execute_query(cql_str)
+        self._execute_concurrent('delete', 'delete_row', [(row_key,) for row_key in row_keys])
         return self
-            
 
-    def _iterate_over_counter_columns(self, func):
-        """
-        calls func on every column that should be in the counter column family.
 
-        func should have a signature like this:
-        func(row_key, col_name, subcol_name=None)
+    def _counter_columns(self):
+        """
+        Returns the (row_key, col_name) of every column that should be in the
+        counter column family.
         """
-        col_count = 0
-        for row_index in xrange(self._params['num_counter_rows']):
-            row_key = self._generate_row_key(row_index)
-            for col_index in xrange(self._params['num_cols']):
-                col_name = self._generate_col_name(col_index)
-                func(row_key, col_name)
-                col_count += 1
-        debug("iterated over %d counter columns" % col_count)
+        columns = [(self._generate_row_key(row_index), self._generate_col_name(col_index))
+                   for row_index in xrange(self._params['num_counter_rows'])
+                   for col_index in xrange(self._params['num_cols'])]
+        debug("iterated over %d counter columns" % len(columns))
+        return columns
 
 
     def _generate_counter(self):
@@ -252,44 +300,30 @@ class LoadMaker(object):
         each with self._params['num_cols'] individual counters.
         This increments each by one.
         """
-        def add_func(row_key, col_name, subcol_name=None):
-            cql_str = """UPDATE %(cf_name)s SET %(col_name)s=%(col_name)s+1
-            WHERE KEY=%(row_key)s;""" % {
-                'cf_name': self._params['column_family_name'],
-                'col_name': col_name,
-                'row_key': row_key,
-            }
-            self.execute_query(cql_str, num_retries=0)
-
-        self._iterate_over_counter_columns(add_func)
+        self._execute_concurrent('generate', 'increment', self._counter_columns())
 
 
     def multiget(self, keys):
         assert len(keys) > 0, "At least one key must be specified!"
-        keys_str = ', '.join("'"+str(key)+"'" for key in keys)
-        cql_str = "SELECT * FROM %s USING CONSISTENCY %s WHERE KEY in (%s)" % (
-            self._params['column_family_name'], self._params['consistency_level'], keys_str)
-        self.execute_query(cql_str)
-        rows = self._cursor.result
+        keys = list(keys)
+        results = self._execute_concurrent('multiget', 'read_row', [(key,) for key in keys])
         out = {}
-        for row in rows:
-            row_key = row[0].value
-            out[row_key] = {}
-            cols = row[1:]
-            for col in cols:
-                col_name = col.name
-                col_value = col.value
-                out[row_key][col_name] = col_value
+        for key, rows in zip(keys, results):
+            if rows:
+                out[key] = dict((col_name, col_value) for col_name, col_value in rows)
 
         return out
-        
 
-    def validate(self, start_index=0, end_index=sys.maxint, step=1, server_list=['localhost:9160']):
+
+    def validate(self, start_index=0, end_index=sys.maxint, step=1, server_list=['localhost:9160'], chunk_size=1000):
         """
         gets the rows from start_index (inclusive) to end_index (exclusive) and
         compares them against what they are supposed to be. If end_index
         is greater than what has been inserted, it will read to the last
-        value that was inserted.
+        value that was inserted. Rows deleted in that range must be gone.
+
+        The rows are expected, read and compared chunk_size at a time, so the
+        memory used does not depend on the number of rows.
         """
         debug("validate() starting " + str(self))
         if end_index > self._inserted_key_count:
@@ -300,37 +334,58 @@ class LoadMaker(object):
             self._validate_counter()
 
         else:
-            # generate what we expect to read
-            rows = self._gen_rows(start_index, end_index, step)
-            read_rows = self.multiget(rows.keys())
-
-            if len(list(read_rows)) < len(rows):
-                raise Exception("number of rows (%s) doesn't match expected number (%s)" % (str(len(read_rows)), str(len(rows))))
-
-            # check every row to make sure everything matches
-            for row_key, row_value in rows.items():
-                read_row_value = read_rows[row_key]
-                if row_value != read_row_value:
-                    raise AssertionError(
-                    "The value written does not match the value read! should be: %s was: %s" %
-                    (pprint.pformat(row_value), pprint.pformat(read_row_value)))
+            checked = 0
+            for chunk in self._chunks(max(start_index, self._deleted_key_count), end_index, step, chunk_size):
+                # generate what we expect to read
+                rows = self._gen_rows(chunk[0], chunk[-1] + 1, step)
+                read_rows = self.multiget(rows.keys())
+
+                if len(read_rows) < len(rows):
+                    missing = sorted(set(rows) - set(read_rows))
+                    raise Exception("number of rows (%s) doesn't match expected number (%s), missing: %s" % (
+                        str(len(read_rows)), str(len(rows)), missing[:10]))
+
+                # check every row to make sure everything matches
+                for row_key, row_value in rows.items():
+                    read_row_value = read_rows[row_key]
+                    if row_value != read_row_value:
+                        raise AssertionError(
+                        "The value written does not match the value read! should be: %s was: %s" %
+                        (pprint.pformat(row_value), pprint.pformat(read_row_value)))
+                checked += len(rows)
 
             # make sure that deleted rows really are gone.
-            row_keys = [self._generate_row_key(i) for i in xrange(0, self._deleted_key_count, step)]
+            deleted = 0
+            for chunk in self._chunks(start_index, min(self._deleted_key_count, end_index), step, chunk_size):
+                row_keys = [self._generate_row_key(i) for i in chunk]
+                read_rows = self.multiget(row_keys)
+                if read_rows:
+                    raise AssertionError("Deleted rows were read back: %s" % pprint.pformat(
+                        dict(read_rows.items()[:10])))
+                deleted += len(row_keys)
+            debug("validate() checked %d rows and %d deleted rows" % (checked, deleted))
 
         debug("validate() succeeded")
         return self
 
 
+    def _chunks(self, start_index, end_index, step, chunk_size):
+        """
+        Yields the indexes from start_index to end_index (exclusive), every
+        step, as consecutive xranges of at most chunk_size indexes.
+        """
+        span = chunk_size * step
+        for chunk_start in xrange(start_index, end_index, span):
+            yield xrange(chunk_start, min(chunk_start + span, end_index), step)
+
+
     def _validate_counter(self):
-        def validate_func(row_key, col_name):
-            assert self._num_generate_calls > 0, "Data must be generated before validating!"
-            cql_str = "SELECT '%s' FROM %s WHERE KEY='%s'"%(col_name, self._params['column_family_name'], row_key)
-            self.execute_query(cql_str)
-            from_db = self._cursor.fetchone()
-            val = from_db[0]
-            assert self._num_generate_calls == val, "A counter did not have the right value! %s != %s, QUERY: %s" %(val, self._num_generate_calls, cql_str)
-        self._iterate_over_counter_columns(validate_func)
+        assert self._num_generate_calls > 0, "Data must be generated before validating!"
+        columns = self._counter_columns()
+        results = self._execute_concurrent('validate', 'read_cell', columns)
+        for (row_key, col_name), rows in zip(columns, results):
+            val = rows[0][0] if rows else None
+            assert self._num_generate_calls == val, "A counter did not have the right value! %s != %s, row %s column %s" %(val, self._num_generate_calls, row_key, col_name)
 
 
     def _gen_rows(self, start_index, end_index, step=1):
@@ -348,7 +403,7 @@ class LoadMaker(object):
                 shift_by_one = 0
             cols = dict((
                     self._generate_col_name(i),
-                    self._generate_col_value(i, is_update))
+                    self._generate_col_value(row_num, i, is_update))
                     for i in xrange(shift_by_one, self._params['num_cols']+shift_by_one))
 
             rows[self._generate_row_key(row_num)] = cols
@@ -364,26 +419,22 @@ class LoadMaker(object):
         return self._convert(prefix='col_', num=num)
 
 
-    def _generate_col_value(self, num, is_update=False):
+    def _generate_col_value(self, row_num, num, is_update=False):
         # is_update means that the value should be modified to indicate it has been updated.
-        prefix = 'val_'
-        if is_update:
-            num += 10000
-            prefix = 'val_updated_'
-        return self._convert(prefix=prefix, num=num)
+        return self._data.text(row_num, self._generate_col_name(num), version=1 if is_update else 0)
 
 
     def _convert(self, prefix=None, num=None):
         return str(prefix + str(num))
 
 
-    def create_keyspace(self, cursor):
+    def create_keyspace(self):
         keyspace_name = self._params['keyspace_name']
-        cql_str = ("CREATE KEYSPACE %s WITH strategy_class=SimpleStrategy AND "
-                "strategy_options:replication_factor=%d" % (keyspace_name, int(self._params['replication_factor'])))
+        cql_str = ("CREATE KEYSPACE %s WITH replication = {'class': 'SimpleStrategy', "
+                "'replication_factor': %d}" % (keyspace_name, int(self._params['replication_factor'])))
         try:
             self.execute_query(cql_str)
-        except cql.ProgrammingError, e:
+        except AlreadyExists:
             # the ks already exists
             pass
 
@@ -392,19 +443,18 @@ class LoadMaker(object):
         """ The columnfamily should not already exist! """
         cf_name = self._params['column_family_name']
         if self._params['is_counter']:
-            cql_str = """
-            CREATE COLUMNFAMILY %s (KEY text PRIMARY KEY) WITH default_validation=counter""" % cf_name
-            self.execute_query(cql_str)
+            value_type = 'counter'
         else:
-            cql_str = """
-            CREATE COLUMNFAMILY %s (KEY %s PRIMARY KEY) WITH comparator=%s
-            AND default_validation=%s""" % (cf_name, 
-                self._params['key_validation_type'],
-                self._params['comparator_type'],
-                self._params['validation_type'])
-            self.execute_query(cql_str)
+            value_type = self._params['validation_type']
+        cql_str = """
+        CREATE TABLE %s (key %s, column1 %s, value %s, PRIMARY KEY (key, column1))
+        WITH COMPACT STORAGE""" % (cf_name,
+            self._params['key_validation_type'],
+            self._params['comparator_type'],
+            value_type)
+        self.execute_query(cql_str)
+
 
-    
     def execute_query(self, cql_str, num_retries=10):
         """
         execute the query, and retry several times if needed.
@@ -412,28 +462,78 @@ class LoadMaker(object):
         debug(cql_str)
         for try_num in xrange(num_retries+1):
             try:
-                self._cursor.execute(cql_str)
-            except cql.ProgrammingError:
-                raise
-            except Exception, e:
+                return self._session.execute(cql_str)
+            except (NoHostAvailable, OperationTimedOut):
                 if try_num == num_retries:
                     raise
-                # try to reconnect
                 time.sleep(1)
-                self.refresh_connection()
-            else:
-                break
 
 
 
-class ContinuousLoader(threading.Thread):
+class _RateLimiter(object):
+    """
+    Spreads statements over time so that, across all the threads that
+    report to it, at most rate statements a second are executed. With no
+    rate, nothing is ever delayed.
+
+    The rate backs off by half whenever a call reports a mean latency above
+    max_latency and then recovers by a tenth per call, up to target.
+    """
+
+    def __init__(self, target=None, max_latency=None):
+        self.target = target
+        self.rate = target
+        self.max_latency = max_latency
+        self._next_free = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, statements, mean_latency=None, throughput=None):
+        """
+        Accounts for statements just executed by a call with the given mean
+        latency and throughput, and sleeps as long as needed.
+        """
+        with self._lock:
+            now = time.time()
+            if self.max_latency is not None and mean_latency is not None:
+                if mean_latency > self.max_latency and throughput:
+                    self.rate = max(min(self.rate or throughput, throughput) / 2.0, 1.0)
+                elif self.rate is not None and self.rate != self.target:
+                    self.rate *= 1.1
+                    if self.target is not None:
+                        self.rate = min(self.rate, self.target)
+            if self.rate is None:
+                return
+            self._next_free = max(self._next_free, now) + statements / float(self.rate)
+            delay = self._next_free - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ContinuousLoader(object):
     """
-    Hits the db continuously with LoadMaker. Can handle standard and 
+    Hits the db continuously with LoadMaker. Can handle standard and
     counter columnfamilies
 
-    Applies each type of load in a round-robin fashion
+    workers threads apply load, each taking the next load_maker that no other
+    worker is using, keys_per_call keys at a time. Every call has up to the
+    load_maker's concurrency statements in flight.
+
+    If ops_per_second is set, the statements are spread to stay under that
+    rate; if max_latency is set, the rate is halved whenever a call's mean
+    latency goes above it. Either way sleep_between seconds are slept after
+    every call. A worker whose calls fail backs off, doubling its wait up to
+    MAX_ERROR_BACKOFF seconds; the first error is raised again by stats(),
+    check_exc() and exit().
     """
-    def __init__(self, load_makers=[], sleep_between=1):
+
+    # seconds over which the live throughput is computed
+    THROUGHPUT_WINDOW = 10
+    # seconds a failing worker waits after its first and after its latest errors
+    MIN_ERROR_BACKOFF = 0.1
+    MAX_ERROR_BACKOFF = 10
+
+    def __init__(self, load_makers=[], sleep_between=1, ops_per_second=None, workers=1,
+                 keys_per_call=3, max_latency=None):
         """
         load_makers is a list of load_makers to run
 
@@ -442,19 +542,35 @@ class ContinuousLoader(threading.Thread):
         """
         self._load_makers = load_makers
         self._sleep_between = sleep_between
-        self._inserting_lock = threading.Lock()
-        self._is_loading = True
+        self._keys_per_call = keys_per_call
+        self._limiter = _RateLimiter(ops_per_second, max_latency)
+        self._free_load_makers = list(load_makers)
+        # cleared while paused; workers only start a call while it is set
+        self._running = threading.Event()
+        self._running.set()
+        self._idle = threading.Condition()
+        self._active_calls = 0
         self._should_exit = False
-        super(ContinuousLoader, self).__init__()
-        self.setDaemon(True)
         self.exception = None
 
+        self._counters_lock = threading.Lock()
+        self._start = time.time()
+        self.calls = 0
+        self.statements = 0
+        self.errors = 0
+        self.last_mean_latency = None
+        # (time, statements) of the calls of the last THROUGHPUT_WINDOW seconds
+        self._recent = collections.deque()
+
         # make sure each loader gets called at least once.
         debug("calling ContinuousLoader()._generate_load_once() from __init__().")
         self._generate_load_once()
 
         # now fire up the loaders to continuously load the system.
-        self.start()
+        self._workers = [threading.Thread(target=self.run, name="ContinuousLoader-%d" % i) for i in xrange(workers)]
+        for worker in self._workers:
+            worker.setDaemon(True)
+            worker.start()
 
 
     def run(self):
@@ -462,43 +578,120 @@ class ContinuousLoader(threading.Thread):
         applies load whenever it isn't paused.
         """
         debug("Loadmaker started")
+        backoff = 0
         while True:
+            self._running.wait()
             if self._should_exit:
                 break
-            self._generate_load_once()
+            load_maker = self._begin_call()
+            if load_maker is None:
+                # more workers than load_makers
+                time.sleep(0.01)
+                continue
+            try:
+                succeeded = self._call(load_maker)
+            finally:
+                self._end_call(load_maker)
+            if succeeded:
+                backoff = 0
+            else:
+                backoff = min(max(backoff * 2, self.MIN_ERROR_BACKOFF), self.MAX_ERROR_BACKOFF)
+                time.sleep(backoff)
+            if self._sleep_between:
+                time.sleep(self._sleep_between)
         debug("continuous loader exiting.")
 
 
+    def _begin_call(self):
+        with self._idle:
+            # checked again under the lock, so that pause() sees every call
+            # that starts after it cleared the flag
+            if not self._running.is_set() or not self._free_load_makers:
+                return None
+            self._active_calls += 1
+            return self._free_load_makers.pop(0)
+
+
+    def _end_call(self, load_maker):
+        with self._idle:
+            self._free_load_makers.append(load_maker)
+            self._active_calls -= 1
+            self._idle.notify_all()
+
+
+    def _call(self, load_maker):
+        """
+        runs one call of load_maker, and returns whether it succeeded.
+        """
+        try:
+            load_maker.generate(num_keys=self._keys_per_call)
+        except Exception as e:
+            # if anything goes wrong, store the exception
+            with self._counters_lock:
+                self.errors += 1
+                if self.exception is None:
+                    e.args = e.args + (str(load_maker), )
+                    self.exception = (e, sys.exc_info()[2])
+            debug("ContinuousLoader call failed: %s" % e)
+            return False
+        stats = load_maker.last_operation_stats
+        now = time.time()
+        with self._counters_lock:
+            self.calls += 1
+            self.statements += stats['statements']
+            self.last_mean_latency = stats['mean_latency']
+            self._recent.append((now, stats['statements']))
+            while self._recent and self._recent[0][0] < now - self.THROUGHPUT_WINDOW:
+                self._recent.popleft()
+        self._limiter.consume(stats['statements'], stats['mean_latency'], stats['ops_per_second'])
+        return True
+
+
     def _generate_load_once(self):
         """
         runs one round of load with all the load_makers.
         """
         debug("ContinuousLoader()._generate_load_once() starting")
         for load_maker in self._load_makers:
-            self._inserting_lock.acquire()
-
-            # exit if needed.
             if self._should_exit:
                 return
-
-            try:
-                load_maker.generate(num_keys=3)
-            except Exception, e:
-                # if anything goes wrong, store the exception
-                e.args = e.args + (str(load_maker), )
-                self.exception = (e, sys.exc_info()[2])
-                raise
-            finally:
-                self._inserting_lock.release()
-            if self._sleep_between:
-                time.sleep(self._sleep_between)
+            self._call(load_maker)
+            self.check_exc()
         debug("ContinuousLoader()._generate_load_once() done.")
 
 
+    def stats(self):
+        """
+        Returns the live counters of the loader: calls, statements and errors
+        so far, the statements per second over the last few seconds, the mean
+        latency of the last call and the current rate limit. Raises the first
+        error of the workers, if any.
+        """
+        self.check_exc()
+        with self._counters_lock:
+            now = time.time()
+            window = min(self.THROUGHPUT_WINDOW, now - self._start)
+            recent = sum(statements for when, statements in self._recent if when >= now - window)
+            return {
+                'calls': self.calls,
+                'statements': self.statements,
+                'errors': self.errors,
+                'ops_per_second': recent / window if window > 0 else 0,
+                'mean_latency': self.last_mean_latency,
+                'rate_limit': self._limiter.rate,
+            }
+
+
     def exit(self):
+        """
+        stops the workers, then raises the first error they hit, if any.
+        """
         self._should_exit = True
-        if self._is_loading == False:
-            self.unpause()
+        self._running.set()
+        for worker in self._workers:
+            worker.join()
+        debug("ContinuousLoader exited after %d calls, %d statements and %d errors" % (self.calls, self.statements, self.errors))
+        self.check_exc()
 
 
     def check_exc(self):
@@ -518,36 +711,38 @@ class ContinuousLoader(threading.Thread):
         debug("read_and_validate()")
         self.check_exc()
         self.pause()
-        debug("Sleeping %.2f seconds.." % pause_before_validate)
-        time.sleep(pause_before_validate)
-        for load_maker in self._load_makers:
-            try:
-                load_maker.validate(step=step)
-            except Exception, e:
-                # put the loader into the exception to make life easier
-                e.args = e.args + (str(load_maker), )
-                raise
-        self.unpause()
+        if pause_before_validate:
+            debug("Sleeping %.2f seconds.." % pause_before_validate)
+            time.sleep(pause_before_validate)
+        try:
+            for load_maker in self._load_makers:
+                try:
+                    load_maker.validate(step=step)
+                except Exception as e:
+                    # put the loader into the exception to make life easier
+                    e.args = e.args + (str(load_maker), )
+                    raise
+        finally:
+            self.unpause()
 
 
     def pause(self):
         """
-        acquires the _inserting_lock to stop the loading from happening.
+        Stops the workers from starting new calls and returns once the calls
+        in progress are done, which is at most one in-flight window each.
         """
-        assert self._is_loading == True, "Called Pause while not loading!"
-        self._inserting_lock.acquire()
+        assert self._running.is_set(), "Called Pause while not loading!"
+        with self._idle:
+            self._running.clear()
+            while self._active_calls:
+                self._idle.wait()
         debug("paused continuousloader...")
-        self._is_loading = False
 
 
     def unpause(self):
         """
-        releases the _inserting_lock to resume loading.
+        lets the workers resume loading.
         """
-        assert self._is_loading == False, "Called Pause while loading!"
+        assert not self._running.is_set(), "Called Pause while loading!"
         debug("unpausing continuousloader...")
-        self._inserting_lock.release()
-        self._is_loading = True
-
-
-
+        self._running.set()
@@ -0,0 +1,112 @@
+"""
+Background archiving of the artifacts of failed tests.
+
+The files are first staged next to the archive: hardlinked when possible,
+otherwise only their tail is copied, so staging is cheap and the cluster can
+be removed right away. A single daemon thread then streams the staged files
+into one compressed tarball per test and removes the staging directory.
+"""
+import atexit
+import os
+import Queue
+import shutil
+import StringIO
+import tarfile
+import threading
+import time
+
+
+class LogArchiver(object):
+    """
+    tail_bytes, if set, caps how much of the end of each file is archived;
+    the head of longer files is dropped at a line boundary.
+    """
+
+    def __init__(self, tail_bytes=None):
+        self.tail_bytes = tail_bytes
+        self.queue = Queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def stage(self, staging_dir, files):
+        """
+        Links (or tail-copies) each (arcname, path) of files into staging_dir
+        and returns the list of (arcname, staged path). Missing files are skipped.
+        """
+        os.makedirs(staging_dir)
+        staged = []
+        for i, (arcname, path) in enumerate(files):
+            if not os.path.isfile(path):
+                continue
+            target = os.path.join(staging_dir, str(i))
+            try:
+                os.link(path, target)
+            except OSError:
+                # most likely a different filesystem; only copy what will be kept
+                with open(path, 'rb') as src:
+                    with open(target, 'wb') as dst:
+                        self._seek_to_tail(src)
+                        shutil.copyfileobj(src, dst)
+            staged.append((arcname, target))
+        return staged
+
+    def submit(self, archive_path, staging_dir, staged, extras=()):
+        """
+        Queues the creation of archive_path from the staged files and from
+        extras, a list of (arcname, text). staging_dir is removed afterwards.
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+                atexit.register(self.flush)
+        self.queue.put((archive_path, staging_dir, staged, list(extras)))
+
+    def flush(self):
+        """Blocks until every submitted archive has been written"""
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self._write(*job)
+            except Exception as e:
+                print "Error archiving logs to %s: %s" % (job[0], e)
+            finally:
+                shutil.rmtree(job[1], ignore_errors=True)
+                self.queue.task_done()
+
+    def _write(self, archive_path, staging_dir, staged, extras):
+        partial = archive_path + '.partial'
+        tar = tarfile.open(partial, 'w:gz')
+        try:
+            for arcname, path in staged:
+                with open(path, 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    start = self._seek_to_tail(f, size)
+                    info = tar.gettarinfo(path, arcname)
+                    info.size = size - start
+                    tar.addfile(info, f)
+                if start > 0:
+                    extras.append((arcname + '.truncated', "first %d bytes omitted\n" % start))
+            for arcname, text in extras:
+                info = tarfile.TarInfo(arcname)
+                info.size = len(text)
+                info.mtime = time.time()
+                tar.addfile(info, StringIO.StringIO(text))
+        finally:
+            tar.close()
+        os.rename(partial, archive_path)
+
+    def _seek_to_tail(self, f, size=None):
+        """Positions f at the first complete line of its tail and returns that offset"""
+        if size is None:
+            size = os.fstat(f.fileno()).st_size
+        if self.tail_bytes is None or size <= self.tail_bytes:
+            f.seek(0)
+            return 0
+        f.seek(size - self.tail_bytes)
+        f.readline()
+        return f.tell()
@@ -0,0 +1,103 @@
+"""
+Node profiles: heap sizes and cassandra.yaml options applied to every node
+of the test classes that select them with a node_profile attribute.
+
+The 'fast' profile is meant for functional tests that only need a node
+that answers queries: small caches and memtables, and no background work
+that such tests never look at. Its 1G heap is what cassandra-env.sh picks
+on the smallest machines, so that tests writing large batches or
+collections are not starved, and the commit log keeps its default segment
+size, which bounds the size of a mutation. Options are listed with the
+first version that knows them, and the last one when they were removed, as
+cassandra refuses to start with an unknown option.
+"""
+import json
+
+from distutils.version import LooseVersion
+
+
+class NodeProfile(object):
+
+    def __init__(self, heap=None, new_gen=None, options=()):
+        self.heap = heap
+        self.new_gen = new_gen
+        # (first version, first version without it or None, {option: value})
+        self.options = options
+
+    def config_options(self, version):
+        """Returns the cassandra.yaml options of this profile that version accepts"""
+        version = LooseVersion(version)
+        values = {}
+        for since, until, options in self.options:
+            if version < LooseVersion(since):
+                continue
+            if until is not None and version >= LooseVersion(until):
+                continue
+            values.update(options)
+        return values
+
+    def environment(self):
+        """The variables read by cassandra-env.sh, which needs both sizes set"""
+        if self.heap is None:
+            return {}
+        return {'MAX_HEAP_SIZE': self.heap, 'HEAP_NEWSIZE': self.new_gen}
+
+
+PROFILES = {
+    'fast': NodeProfile(heap='1G', new_gen='256M', options=[
+        ('1.0', None, {
+            'compaction_throughput_mb_per_sec': 0,
+            'concurrent_compactors': 1,
+            'memtable_flush_writers': 1,
+            'auto_snapshot': False,
+        }),
+        ('1.1', None, {
+            'key_cache_size_in_mb': 8,
+            'key_cache_save_period': 0,
+            'row_cache_size_in_mb': 0,
+        }),
+        ('1.1', '2.1', {
+            'memtable_total_space_in_mb': 64,
+        }),
+        ('2.1', None, {
+            'memtable_heap_space_in_mb': 64,
+            'counter_cache_size_in_mb': 0,
+            'index_summary_resize_interval_in_minutes': -1,
+        }),
+    ]),
+}
+
+
+def get_profile(name):
+    if name not in PROFILES:
+        raise ValueError("unknown node profile %s, expected one of %s" % (name, ', '.join(sorted(PROFILES))))
+    return PROFILES[name]
+
+
+def process_memory(pid):
+    """Returns (resident, peak resident) bytes of pid, or None if it is gone"""
+    memory = {}
+    try:
+        with open('/proc/%s/status' % pid) as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    field, value = line.split(':', 1)
+                    memory[field] = int(value.split()[0]) * 1024
+    except IOError:
+        return None
+    return memory.get('VmRSS'), memory.get('VmHWM')
+
+
+def record_node_stats(path, test_id, profile, nodes):
+    """
+    Appends one JSON line for test_id to path with, for each of the
+    (name, start seconds, pid) of nodes, its start time and memory use.
+    """
+    stats = {}
+    for name, start_seconds, pid in nodes:
+        memory = process_memory(pid) if pid else None
+        rss, peak_rss = memory if memory else (None, None)
+        stats[name] = {'start_seconds': start_seconds, 'rss': rss, 'peak_rss': peak_rss}
+    with open(path, 'a') as f:
+        f.write(json.dumps({'test': test_id, 'profile': profile, 'nodes': stats}, sort_keys=True) + '\n')
+    return stats
@@ -0,0 +1,147 @@
+"""
+Paging latency benchmarks.
+
+Each test loads one shape of data, then pages through it with every
+combination of BENCHMARK_FETCH_SIZES and BENCHMARK_CONSISTENCY_LEVELS, and
+appends one JSON object per combination to PAGING_BENCHMARK_OUTPUT with the
+cassandra version, the time to the first page, the p50/p99 of the time
+taken by the following pages and the rows read per second (the medians of
+PAGING_BENCHMARK_RUNS runs, after a warm up run).
+
+The tests only run when PAGING_BENCHMARK is set, as they are long and
+assert nothing beyond the row counts.
+"""
+import json
+import os
+import time
+
+from cassandra import ConsistencyLevel as CL
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.query import SimpleStatement
+
+from dtest import LOG_SAVED_DIR, debug, installed_cassandra_version
+from paging_test import BasePagingTester, PageFetcher, latency_stats
+from pytools import add_skip_check, since
+
+PAGING_BENCHMARK = os.environ.get('PAGING_BENCHMARK', '').lower() in ('yes', 'true')
+PAGING_BENCHMARK_OUTPUT = os.environ.get('PAGING_BENCHMARK_OUTPUT', os.path.join(LOG_SAVED_DIR, 'paging_benchmark.jsonl'))
+PAGING_BENCHMARK_ROWS = int(os.environ.get('PAGING_BENCHMARK_ROWS', '50000'))
+PAGING_BENCHMARK_RUNS = int(os.environ.get('PAGING_BENCHMARK_RUNS', '3'))
+
+BENCHMARK_FETCH_SIZES = (100, 1000, 5000)
+BENCHMARK_CONSISTENCY_LEVELS = ('ONE', 'QUORUM')
+# rows per partition of the many partitions shape
+NARROW_PARTITION_ROWS = 10
+
+
+def benchmark(f):
+    add_skip_check(f, f, lambda version: None if PAGING_BENCHMARK else "set PAGING_BENCHMARK to run the paging benchmarks")
+    return f
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) / 2]
+
+
+class TestPagingBenchmark(BasePagingTester):
+
+    def prepare_data(self, partitions, rows_per_partition, index=False):
+        """
+        Creates and fills paging_benchmark with partitions of
+        rows_per_partition rows. Rows with an even clustering key have
+        category 'even', which is indexed if index is set.
+        """
+        cursor = self.prepare()
+        self.create_ks(cursor, 'paging_benchmark', 3)
+        cursor.execute("CREATE TABLE paging_benchmark ( id int, ck int, category text, value text, PRIMARY KEY (id, ck) )")
+        if index:
+            cursor.execute("CREATE INDEX ON paging_benchmark (category)")
+
+        insert = cursor.prepare("INSERT INTO paging_benchmark (id, ck, category, value) VALUES (?, ?, ?, ?)")
+        insert.consistency_level = CL.ALL
+        value = 'x' * 100
+        for id in xrange(partitions):
+            params = [(id, ck, 'even' if ck % 2 == 0 else 'odd', value) for ck in xrange(rows_per_partition)]
+            # a wide partition is written in chunks
+            for start in xrange(0, len(params), 1000):
+                execute_concurrent_with_args(cursor, insert, params[start:start + 1000], concurrency=100)
+        return cursor
+
+    def page_through(self, cursor, query, fetch_size, consistency):
+        """Reads all the pages of query and returns (rows, time to first page, latencies of the other pages, seconds)"""
+        start = time.time()
+        future = cursor.execute_async(
+            SimpleStatement(query, fetch_size=fetch_size, consistency_level=CL.name_to_value[consistency])
+        )
+        pf = PageFetcher(future)
+        first_page = time.time() - start
+        pf.request_all()
+        return len(pf.all_data()), first_page, pf.latencies[1:], time.time() - start
+
+    def run_benchmark(self, cursor, shape, query, expected_rows):
+        version = installed_cassandra_version()
+        for fetch_size in BENCHMARK_FETCH_SIZES:
+            for consistency in BENCHMARK_CONSISTENCY_LEVELS:
+                # warm up
+                self.page_through(cursor, query, fetch_size, consistency)
+
+                runs = []
+                for i in xrange(PAGING_BENCHMARK_RUNS):
+                    rows, first_page, latencies, seconds = self.page_through(cursor, query, fetch_size, consistency)
+                    self.assertEqual(rows, expected_rows)
+                    stats = latency_stats(latencies)
+                    runs.append({
+                        'time_to_first_page': first_page,
+                        'page_p50': stats.get('p50'),
+                        'page_p99': stats.get('p99'),
+                        'pages': stats['count'] + 1,
+                        'seconds': seconds,
+                        'rows_per_second': rows / seconds,
+                    })
+
+                result = {
+                    'version': version,
+                    'shape': shape,
+                    'query': query,
+                    'rows': expected_rows,
+                    'fetch_size': fetch_size,
+                    'consistency': consistency,
+                    'runs': runs,
+                }
+                for measure in ('time_to_first_page', 'page_p50', 'page_p99', 'rows_per_second'):
+                    values = [run[measure] for run in runs if run[measure] is not None]
+                    result[measure] = median(values) if values else None
+                debug("{shape} fetch_size={fetch_size} {consistency}: first page {time_to_first_page:.4f}s, "
+                      "rows/s {rows_per_second:.0f}".format(**result))
+                with open(PAGING_BENCHMARK_OUTPUT, 'a') as f:
+                    f.write(json.dumps(result, sort_keys=True) + '\n')
+
+    @since('2.0')
+    @benchmark
+    def test_wide_partition(self):
+        cursor = self.prepare_data(1, PAGING_BENCHMARK_ROWS)
+        self.run_benchmark(cursor, 'wide_partition', "SELECT * FROM paging_benchmark WHERE id = 0", PAGING_BENCHMARK_ROWS)
+
+    @since('2.0')
+    @benchmark
+    def test_many_partitions(self):
+        partitions = PAGING_BENCHMARK_ROWS / NARROW_PARTITION_ROWS
+        cursor = self.prepare_data(partitions, NARROW_PARTITION_ROWS)
+        self.run_benchmark(cursor, 'many_partitions', "SELECT * FROM paging_benchmark", partitions * NARROW_PARTITION_ROWS)
+
+    @since('2.0')
+    @benchmark
+    def test_allow_filtering(self):
+        partitions = PAGING_BENCHMARK_ROWS / NARROW_PARTITION_ROWS
+        cursor = self.prepare_data(partitions, NARROW_PARTITION_ROWS)
+        self.run_benchmark(cursor, 'allow_filtering', "SELECT * FROM paging_benchmark WHERE ck < 5 ALLOW FILTERING",
+                           partitions * 5)
+
+    @since('2.0')
+    @benchmark
+    def test_secondary_index(self):
+        partitions = PAGING_BENCHMARK_ROWS / NARROW_PARTITION_ROWS
+        cursor = self.prepare_data(partitions, NARROW_PARTITION_ROWS, index=True)
+        self.run_benchmark(cursor, 'secondary_index', "SELECT * FROM paging_benchmark WHERE category = 'even'",
+                           partitions * ((NARROW_PARTITION_ROWS + 1) / 2))
@@ -1,3 +1,4 @@
+import threading
 import time
 import uuid
 
@@ -7,19 +8,44 @@ from cassandra.query import SimpleStatement, dict_factory
 from dtest import Tester, run_scenarios
 from pytools import since
 
-from datahelp import create_rows, parse_data_into_dicts, flatten_into_set
+from datahelp import create_rows, parse_data_into_dicts, compare_rows
 
 
 class Page(object):
     data = None
+    latency = None
 
-    def __init__(self):
+    def __init__(self, latency=None):
         self.data = []
+        self.latency = latency
 
     def add_row(self, row):
         self.data.append(row)
 
 
+def latency_stats(latencies):
+    """
+    Returns the count, min, mean, max and 50th, 95th and 99th percentiles
+    of latencies.
+    """
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'count': 0}
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+    return {
+        'count': len(latencies),
+        'min': latencies[0],
+        'mean': sum(latencies) / len(latencies),
+        'max': latencies[-1],
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'p99': percentile(99),
+    }
+
+
 class PageFetcher(object):
     """
     Requests pages, handles their receipt,
@@ -27,6 +53,11 @@ class PageFetcher(object):
 
     The first page is automatically retrieved, so an initial
     call to request_one is actually getting the *second* page!
+
+    Pages are delivered by the driver's callbacks, which wake up
+    the thread waiting for them. The time between the request and
+    the delivery of each page is kept in latencies, and the time
+    until the driver reported an error in error_latencies.
     """
     pages = None
     error = None
@@ -34,15 +65,17 @@ class PageFetcher(object):
     requested_pages = None
     retrieved_pages = None
     retrieved_empty_pages = None
+    latencies = None
+    error_latencies = None
 
     def __init__(self, future):
         self.pages = []
+        self.latencies = []
+        self.error_latencies = []
+        # guards the counts and is notified at each delivery
+        self.condition = threading.Condition()
+        self.request_times = [time.time()]
 
-        self.future = future
-        self.future.add_callbacks(
-            callback=self.handle_page,
-            errback=self.handle_error
-        )
         # the first page is automagically returned (eventually)
         # so we'll count this as a request, but the retrieved count
         # won't be incremented until it actually arrives
@@ -50,28 +83,50 @@ class PageFetcher(object):
         self.retrieved_pages = 0
         self.retrieved_empty_pages = 0
 
+        # the callback runs right away if the first page is already there
+        self.future = future
+        self.future.add_callbacks(
+            callback=self.handle_page,
+            errback=self.handle_error
+        )
+
         # wait for the first page to arrive, otherwise we may call
         # future.has_more_pages too early, since it should only be
         # called after the first page is returned
         self.wait(seconds=30)
 
     def handle_page(self, rows):
-        # occasionally get a final blank page that is useless
-        if rows == []:
-            self.retrieved_empty_pages += 1
-            return
-
-        page = Page()
-        self.pages.append(page)
-
-        for row in rows:
-            page.add_row(row)
-
-        self.retrieved_pages += 1
+        with self.condition:
+            latency = time.time() - self._request_time()
+            self.latencies.append(latency)
+
+            # occasionally get a final blank page that is useless
+            if rows == []:
+                self.retrieved_empty_pages += 1
+            else:
+                page = Page(latency)
+                for row in rows:
+                    page.add_row(row)
+                self.pages.append(page)
+                self.retrieved_pages += 1
+
+            self.condition.notify_all()
 
     def handle_error(self, exc):
-        self.error = exc
-        raise exc
+        with self.condition:
+            self.error_latencies.append(time.time() - self._request_time())
+            self.error = exc
+            self.condition.notify_all()
+
+    def _request_time(self):
+        # when the request answered by the current delivery was made
+        return self.request_times[len(self.latencies) + len(self.error_latencies)]
+
+    def _request_next(self):
+        with self.condition:
+            self.request_times.append(time.time())
+            self.requested_pages += 1
+        self.future.start_fetching_next_page()
 
     def request_one(self):
         """
@@ -80,8 +135,7 @@ class PageFetcher(object):
         If the future is exhausted, this is a no-op.
         """
         if self.future.has_more_pages:
-            self.future.start_fetching_next_page()
-            self.requested_pages += 1
+            self._request_next()
             self.wait()
 
         return self
@@ -93,8 +147,7 @@ class PageFetcher(object):
         If the future is exhausted, this is a no-op.
         """
         while self.future.has_more_pages:
-            self.future.start_fetching_next_page()
-            self.requested_pages += 1
+            self._request_next()
             self.wait()
 
         return self
@@ -105,15 +158,28 @@ class PageFetcher(object):
 
         Requests are made by calling request_one and/or request_all.
 
-        Raises RuntimeError if seconds is exceeded.
+        Raises RuntimeError if seconds is exceeded, or if the driver
+        reported an error instead of a page.
         """
         expiry = time.time() + seconds
 
-        while time.time() < expiry:
-            if self.requested_pages == (self.retrieved_pages + self.retrieved_empty_pages):
-                return self
+        with self.condition:
+            while self.requested_pages != (self.retrieved_pages + self.retrieved_empty_pages):
+                if self.error is not None:
+                    raise RuntimeError("Requested pages were not delivered: {}".format(self.error))
+                remaining = expiry - time.time()
+                if remaining <= 0:
+                    raise RuntimeError("Requested pages were not delivered before timeout.")
+                self.condition.wait(remaining)
 
-        raise RuntimeError("Requested pages were not delivered before timeout.")
+        return self
+
+    def latency_stats(self):
+        """
+        Returns the latency_stats of the seconds each page retrieved
+        so far took to arrive after it was requested.
+        """
+        return latency_stats(self.latencies)
 
     def pagecount(self):
         """
@@ -163,10 +229,14 @@ class PageFetcher(object):
 class PageAssertionMixin(object):
     """Can be added to subclasses of unittest.Tester"""
     def assertEqualIgnoreOrder(self, actual, expected):
-        return self.assertItemsEqual(actual, expected)
+        difference = compare_rows(actual, expected)
+        if difference is not None:
+            self.fail(difference)
 
     def assertIsSubsetOf(self, subset, superset):
-        assert flatten_into_set(subset).issubset(flatten_into_set(superset))
+        difference = compare_rows(subset, superset, subset=True)
+        if difference is not None:
+            self.fail(difference)
 
 
 class BasePagingTester(Tester):
@@ -808,7 +878,7 @@ class TestPagingDatasetChanges(BasePagingTester, PageAssertionMixin):
 
         # stop a node and make sure we get an error trying to page the rest
         node1.stop()
-        with self.assertRaisesRegexp(RuntimeError, 'Requested pages were not delivered before timeout'):
+        with self.assertRaisesRegexp(RuntimeError, 'Requested pages were not delivered'):
             pf.request_all()
 
         # TODO: can we resume the node and expect to get more results from the result set or is it done?
@@ -0,0 +1,175 @@
+"""
+Breakdown of where the time of each test goes.
+
+Every test is split into its setUp, its body and its tearDown, and the time
+spent in the harness primitives (starting nodes, waiting on logs, retries,
+sleeps, log scanning...) is taken out of whichever of those three it
+happened in. Primitives do not nest: a watch_log_for inside a node start
+counts as node start, so the phases of a test always add up to its total.
+
+One JSON object per test is appended to the output file, followed by a
+summary of the whole session when the process exits.
+"""
+import atexit
+import functools
+import json
+import threading
+import time
+
+from collections import defaultdict
+
+SLOWEST_TESTS = 10
+
+
+class PhaseProfiler(object):
+
+    def __init__(self, path, enabled=False):
+        self.path = path
+        self.enabled = enabled
+        self.record = None
+        # [phase, start of the part not charged yet]; the bottom entry is the
+        # setUp/test/tearDown base phase and there is at most one primitive above it
+        self.stack = []
+        self.thread = None
+        self.session_start = time.time()
+        self.tests = 0
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.slowest = []
+        self.summary_registered = False
+
+    def install(self):
+        """
+        Times the ccm node and cluster methods and time.sleep for the rest
+        of the process. Only calls made by the thread running the test count.
+        """
+        from ccmlib.cluster import Cluster
+        from ccmlib.node import Node
+        for cls, attr, phase in ((Cluster, 'start', 'cluster_start'),
+                                 (Cluster, 'stop', 'cluster_stop'),
+                                 (Node, 'start', 'cluster_start'),
+                                 (Node, 'stop', 'cluster_stop'),
+                                 (Node, 'watch_log_for', 'watch_log_for'),
+                                 (Node, 'nodetool', 'nodetool')):
+            setattr(cls, attr, self.timed(phase)(getattr(cls, attr)))
+        time.sleep = self.timed('sleep')(time.sleep)
+
+    def begin(self, test_id):
+        if not self.enabled:
+            return
+        if self.record is not None:
+            # the previous test never reached its tearDown
+            self.end('incomplete')
+        now = time.time()
+        self.thread = threading.current_thread()
+        self.record = {'test': test_id, 'start': now, 'phases': defaultdict(float), 'calls': defaultdict(int)}
+        self.stack = [['setUp', now]]
+        if not self.summary_registered:
+            atexit.register(self.summary)
+            self.summary_registered = True
+
+    def switch(self, base_phase):
+        """Moves the test on to its next base phase, 'test' or 'tearDown'"""
+        if self.record is None:
+            return
+        self._charge(time.time())
+        self.stack[0][0] = base_phase
+
+    def end(self, outcome):
+        """Appends the record of the current test to the output file"""
+        if self.record is None:
+            return
+        now = time.time()
+        self._charge(now)
+        record, self.record, self.stack = self.record, None, []
+        record['outcome'] = outcome
+        record['total'] = now - record['start']
+        self.tests += 1
+        for phase, duration in record['phases'].items():
+            self.totals[phase] += duration
+        for phase, count in record['calls'].items():
+            self.calls[phase] += count
+        self.slowest = sorted(self.slowest + [(record['total'], record['test'])], reverse=True)[:SLOWEST_TESTS]
+        self._append(record)
+
+    @property
+    def active(self):
+        return self.record is not None and len(self.stack) == 1 and threading.current_thread() is self.thread
+
+    def timed(self, phase):
+        """Decorator charging the calls of the decorated function to phase"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.active:
+                    return func(*args, **kwargs)
+                self._push(phase)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._pop()
+            return wrapper
+        return decorator
+
+    def phase(self, phase):
+        """Context manager version of timed"""
+        return _Phase(self, phase)
+
+    def summary(self):
+        if not self.tests:
+            return
+        summary = {
+            'summary': True,
+            'tests': self.tests,
+            'wall_time': time.time() - self.session_start,
+            'phases': dict(self.totals),
+            'calls': dict(self.calls),
+            'slowest': [{'test': test, 'total': total} for total, test in self.slowest],
+        }
+        self._append(summary)
+        test_time = sum(self.totals.values())
+        print "Time spent in %d tests: %.1fs" % (self.tests, test_time)
+        for phase, duration in sorted(self.totals.items(), key=lambda item: -item[1]):
+            print "  %-16s %9.1fs %5.1f%% (%d calls)" % (phase, duration, 100 * duration / test_time if test_time else 0, self.calls.get(phase, 0))
+
+    def _push(self, phase):
+        now = time.time()
+        self._charge(now)
+        self.stack.append([phase, now])
+        self.record['calls'][phase] += 1
+
+    def _pop(self):
+        now = time.time()
+        self._charge(now)
+        self.stack.pop()
+        self.stack[-1][1] = now
+
+    def _charge(self, now):
+        current = self.stack[-1]
+        self.record['phases'][current[0]] += now - current[1]
+        current[1] = now
+
+    def _append(self, record):
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+        except IOError as e:
+            print "Error writing phase profile to %s: %s" % (self.path, e)
+
+
+class _Phase(object):
+
+    def __init__(self, profiler, phase):
+        self.profiler = profiler
+        self.phase = phase
+        self.pushed = False
+
+    def __enter__(self):
+        if self.profiler.active:
+            self.profiler._push(self.phase)
+            self.pushed = True
+
+    def __exit__(self, *exc_info):
+        if self.pushed:
+            self.profiler._pop()
+        return False
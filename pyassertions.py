@@ -1,7 +1,7 @@
 import re
 from cassandra import InvalidRequest, Unavailable, ConsistencyLevel, WriteTimeout, ReadTimeout
 from cassandra.query import SimpleStatement
-from pytools import rows_to_list
+from pytools import PagedRows
 
 def assert_unavailable(fun, *args):
     try:
@@ -27,23 +27,41 @@ def assert_invalid(session, query, matching=None, expected=InvalidRequest):
         if matching is not None:
             assert re.search(matching, msg), "Error message does not contain " + matching + " (error = " + msg + ")"
 
+_NO_ROW = object()
+
+def _assert_rows(cursor, query, expected, cl, fetch_size=None):
+    """
+    Compares the rows of query, as lists and page by page as they arrive,
+    with the expected iterable and fails at the first one that differs,
+    reporting only its index and the expected and actual rows.
+    """
+    if fetch_size is None:
+        simple_query = SimpleStatement(query, consistency_level=cl)
+    else:
+        simple_query = SimpleStatement(query, consistency_level=cl, fetch_size=fetch_size)
+    expected = iter(expected)
+    count = 0
+    for row in PagedRows(cursor, simple_query):
+        row = list(row)
+        expected_row = next(expected, _NO_ROW)
+        assert expected_row is not _NO_ROW, "Expected %d rows from %s, but got more, starting with row %d: %s" % (count, query, count, row)
+        assert row == expected_row, "Expected %s from %s at row %d, but got %s" % (expected_row, query, count, row)
+        count += 1
+    expected_row = next(expected, _NO_ROW)
+    assert expected_row is _NO_ROW, "Expected %s from %s at row %d, but got only %d rows" % (expected_row, query, count, count)
+
 def assert_one(cursor, query, expected, cl=ConsistencyLevel.ONE):
-    simple_query = SimpleStatement(query, consistency_level=cl)
-    res = cursor.execute(simple_query)
-    list_res = rows_to_list(res)
-    assert list_res == [expected], "Expected %s from %s, but got %s" % (expected, query, list_res)
+    _assert_rows(cursor, query, [expected], cl)
 
 def assert_none(cursor, query, cl=ConsistencyLevel.ONE):
-    simple_query = SimpleStatement(query, consistency_level=cl)
-    res = cursor.execute(simple_query)
-    list_res = rows_to_list(res)
-    assert list_res == [], "Expected nothing from %s, but got %s" % (query, list_res)
-
-def assert_all(cursor, query, expected, cl=ConsistencyLevel.ONE):
-    simple_query = SimpleStatement(query, consistency_level=cl)
-    res = cursor.execute(simple_query)
-    list_res = rows_to_list(res)
-    assert list_res == expected, "Expected %s from %s, but got %s" % (expected, query, list_res)
+    _assert_rows(cursor, query, [], cl)
+
+def assert_all(cursor, query, expected, cl=ConsistencyLevel.ONE, fetch_size=None):
+    """
+    expected can be any iterable of rows, e.g. a generator, which is
+    consumed as the pages arrive.
+    """
+    _assert_rows(cursor, query, expected, cl, fetch_size)
 
 def assert_almost_equal(*args, **kwargs):
     try:
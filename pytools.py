@@ -1,11 +1,110 @@
 from ccmlib.node import Node
+from worker_allocator import current_allocation
 from decorator  import decorator
 from distutils.version import LooseVersion
-import re, os, sys, fileinput, time
+import re, os, sys, fileinput, time, threading
+from collections import deque
 
 from cassandra import ConsistencyLevel
 from cassandra.query import SimpleStatement
 
+class PagedRows(object):
+    """
+    Iterates lazily over the rows of a query, fetching the following pages
+    while the rows of the current one are consumed.
+
+    Fetching stops, until the iteration catches up, when prefetch pages are
+    waiting to be consumed or when max_buffered_rows rows are. Iterating
+    raises the driver error, if any, and RuntimeError if no page arrives
+    within timeout seconds.
+
+    page_latencies and page_sizes have the seconds from the request of each
+    page to its arrival and its number of rows; wait_seconds is the time the
+    iteration spent waiting for pages.
+    """
+
+    def __init__(self, session, query, parameters=None, prefetch=2, max_buffered_rows=None, timeout=30):
+        self.prefetch = max(1, prefetch)
+        self.max_buffered_rows = max_buffered_rows
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.pages = deque()
+        self.buffered_rows = 0
+        self.page_latencies = []
+        self.page_sizes = []
+        self.wait_seconds = 0.0
+        self.fetching = True
+        self.done = False
+        self.error = None
+        self.requested_at = time.time()
+        self.future = session.execute_async(query, parameters)
+        self.future.add_callbacks(callback=self._handle_page, errback=self._handle_error)
+
+    def _handle_page(self, rows):
+        with self.condition:
+            try:
+                # results without rows come as None
+                rows = rows or []
+                self.page_latencies.append(time.time() - self.requested_at)
+                self.page_sizes.append(len(rows))
+                if rows:
+                    self.pages.append(rows)
+                    self.buffered_rows += len(rows)
+                self.fetching = False
+                self.done = not self.future.has_more_pages
+                self._fetch_if_room()
+            except Exception as e:
+                # the driver would swallow it and leave the iteration waiting
+                self.error = e
+            self.condition.notify_all()
+
+    def _handle_error(self, exc):
+        with self.condition:
+            self.fetching = False
+            self.error = exc
+            self.condition.notify_all()
+
+    def _fetch_if_room(self):
+        # called with the condition held
+        if self.fetching or self.done or self.error is not None:
+            return
+        if len(self.pages) >= self.prefetch:
+            return
+        if self.max_buffered_rows is not None and self.buffered_rows >= self.max_buffered_rows:
+            return
+        self.fetching = True
+        self.requested_at = time.time()
+        self.future.start_fetching_next_page()
+
+    def _next_page(self):
+        with self.condition:
+            if not self.pages and not self.done and self.error is None:
+                start = time.time()
+                try:
+                    while not self.pages and not self.done and self.error is None:
+                        remaining = start + self.timeout - time.time()
+                        if remaining <= 0:
+                            raise RuntimeError("No page arrived in %s seconds" % self.timeout)
+                        self.condition.wait(remaining)
+                finally:
+                    self.wait_seconds += time.time() - start
+            if self.error is not None:
+                raise self.error
+            if not self.pages:
+                return None
+            rows = self.pages.popleft()
+            self.buffered_rows -= len(rows)
+            self._fetch_if_room()
+            return rows
+
+    def __iter__(self):
+        while True:
+            rows = self._next_page()
+            if rows is None:
+                return
+            for row in rows:
+                yield row
+
 def rows_to_list(rows):
     new_list = [list(row) for row in rows]
     return new_list
@@ -25,17 +124,21 @@ def query_c1c2(session, key, consistency=ConsistencyLevel.QUORUM):
     assert len(res) == 2 and res[0] == 'value1' and res[1] == 'value2', res
 
 # work for cluster started by populate
-def new_node(cluster, bootstrap=True, token=None, remote_debug_port='2000', data_center=None):
+def new_node(cluster, bootstrap=True, token=None, remote_debug_port=None, data_center=None):
     i = len(cluster.nodes) + 1
+    allocation = current_allocation()
+    address = allocation.address(i)
+    if remote_debug_port is None:
+        remote_debug_port = allocation.remote_debug_port(i)
     node = Node('node%s' % i,
                 cluster,
                 bootstrap,
-                ('127.0.0.%s' % i, 9160),
-                ('127.0.0.%s' % i, 7000),
-                str(7000 + i * 100),
+                (address, 9160),
+                (address, 7000),
+                allocation.jmx_port(i),
                 remote_debug_port,
                 token,
-                binary_interface=('127.0.0.%s' % i, 9042))
+                binary_interface=(address, 9042))
     cluster.add(node, not bootstrap, data_center=data_center)
     return node
 
@@ -124,14 +227,17 @@ def range_putget(cluster, cursor, cl=ConsistencyLevel.QUORUM):
 
     _put_with_overwrite(cluster, cursor, keys, cl)
 
-    paged_results = cursor.execute('SELECT * FROM cf LIMIT 10000000')
-    rows = [result for result in paged_results]
+    # validated as the pages arrive, 100 rows (a partition) at a time
+    count = 0
+    res = []
+    for row in PagedRows(cursor, 'SELECT * FROM cf LIMIT 10000000'):
+        count += 1
+        res.append(row)
+        if len(res) == 100:
+            _validate_row(cluster, res)
+            res = []
 
-    assert len(rows) == keys * 100, len(rows)
-    for k in xrange(0, keys):
-        res = rows[:100]
-        del rows[:100]
-        _validate_row(cluster, res)
+    assert count == keys * 100, count
 
 def replace_in_file(filepath, search_replacements):
     """In-place file search and replace.
@@ -148,12 +254,21 @@ def replace_in_file(filepath, search_replacements):
             line = re.sub(regex, replacement, line)
         sys.stdout.write(line)
 
+def add_skip_check(wrapped, f, check):
+    """
+    Attaches check to the decorated test so that Tester.setUp can skip it
+    before any cluster is built. check(version) is given the installed
+    cassandra version and returns the reason to skip, or None.
+    """
+    wrapped.skip_checks = getattr(f, 'skip_checks', []) + [check]
+
 def not_implemented(f):
     def wrapped(obj):
         obj.skip("this test not implemented")
         f(obj)
     wrapped.__name__ = f.__name__
     wrapped.__doc__ = f.__doc__
+    add_skip_check(wrapped, f, lambda version: "this test not implemented")
     return wrapped
 
 class since(object):
@@ -163,17 +278,24 @@ class since(object):
         if self.max_version is not None:
             self.max_version = LooseVersion(self.max_version)
 
+    def check(self, version):
+        cluster_version = LooseVersion(version)
+        if cluster_version < self.cass_version:
+            return "%s < %s" % (cluster_version, self.cass_version)
+        if self.max_version and \
+                cluster_version[:len(self.max_version)] > self.max_version:
+            return "%s > %s" %(cluster_version, self.max_version)
+        return None
+
     def __call__(self, f):
         def wrapped(obj):
-            cluster_version = LooseVersion(obj.cluster.version())
-            if cluster_version < self.cass_version:
-                obj.skip("%s < %s" % (cluster_version, self.cass_version))
-            if self.max_version and \
-                    cluster_version[:len(self.max_version)] > self.max_version:
-                obj.skip("%s > %s" %(cluster_version, self.max_version))
+            reason = self.check(obj.cluster.version())
+            if reason:
+                obj.skip(reason)
             f(obj)
         wrapped.__name__ = f.__name__
         wrapped.__doc__ = f.__doc__
+        add_skip_check(wrapped, f, self.check)
         return wrapped
 
 from dtest import DISABLE_VNODES
@@ -186,6 +308,7 @@ class no_vnodes(object):
             f(obj)
         wrapped.__name__ = f.__name__
         wrapped.__doc__ = f.__doc__
+        add_skip_check(wrapped, f, lambda version: None if DISABLE_VNODES else "Test disabled for vnodes")
         return wrapped
 
 class require(object):
@@ -198,4 +321,5 @@ class require(object):
             f(obj)
         wrapped.__name__ = f.__name__
         wrapped.__doc__ = f.__doc__
+        add_skip_check(wrapped, f, lambda version: "require " + self.msg)
         return wrapped
\ No newline at end of file
@@ -3,19 +3,17 @@ from dtest import Tester, debug
 from cassandra import ConsistencyLevel
 from cassandra.query import SimpleStatement
 from pytools import no_vnodes, insert_c1c2, query_c1c2
+from replica_checker import ReplicaChecker, DIRECT_READ_OPTIONS
 
 class TestRepair(Tester):
 
-    def check_rows_on_node(self, node_to_check, rows, found=[], missings=[], restart=True):
-        stopped_nodes = []
-        for node in self.cluster.nodes.values():
-            if node.is_running() and node is not node_to_check:
-                stopped_nodes.append(node)
-                node.stop(wait_other_notice=True)
+    def check_rows_on_node(self, checker, node_to_check, rows, found=[], missings=[]):
+        # reads at ONE through node_to_check are served by node_to_check
+        # itself, see replica_checker
+        count = checker.count(node_to_check)
+        assert count == rows, count
 
-        cursor = self.patient_cql_connection(node_to_check, 'ks')
-        result = cursor.execute("SELECT * FROM cf LIMIT %d" % (rows * 2))
-        assert len(result) == rows, len(result)
+        cursor = self.patient_exclusive_cql_connection(node_to_check, 'ks')
 
         for k in found:
             query_c1c2(cursor, k, ConsistencyLevel.ONE)
@@ -25,10 +23,6 @@ class TestRepair(Tester):
             res = cursor.execute(query)
             assert len(filter(lambda x: len(x) != 0, res)) == 0, res
 
-        if restart:
-            for node in stopped_nodes:
-                node.start(wait_other_notice=True)
-
     def simple_repair_test(self, ):
         self._simple_repair()
 
@@ -37,14 +31,24 @@ class TestRepair(Tester):
         self._simple_repair(order_preserving_partitioner=True)
 
     def _simple_repair(self, order_preserving_partitioner=False):
+        """
+        The replicas are checked with ReplicaChecker, which needs the cluster
+        to run with DIRECT_READ_OPTIONS: the rack inferring snitch replaces
+        the default one and the dynamic snitch is off on every node. The
+        checker also ALTERs ks.cf to turn off read repair and speculative
+        retry.
+        """
         cluster = self.cluster
 
         if order_preserving_partitioner:
             cluster.set_partitioner('org.apache.cassandra.dht.ByteOrderedPartitioner')
 
         # Disable hinted handoff and set batch commit log so this doesn't
-        # interfer with the test (this must be after the populate)
-        cluster.set_configuration_options(values={ 'hinted_handoff_enabled' : False}, batch_commitlog=True)
+        # interfer with the test (this must be after the populate), and have
+        # reads at ONE served by the coordinator so each node can be checked
+        options = { 'hinted_handoff_enabled' : False }
+        options.update(DIRECT_READ_OPTIONS)
+        cluster.set_configuration_options(values=options, batch_commitlog=True)
         debug("Starting cluster..")
         cluster.populate(3).start()
         [node1, node2, node3] = cluster.nodelist()
@@ -65,19 +69,20 @@ class TestRepair(Tester):
             insert_c1c2(cursor, i, ConsistencyLevel.ALL)
 
         cluster.flush()
+        checker = ReplicaChecker(self, 'ks', 'cf')
 
         # Verify that node3 has only 2000 keys
         debug("Checking data on node3...")
-        self.check_rows_on_node(node3, 2000, missings=[1000])
+        self.check_rows_on_node(checker, node3, 2000, missings=[1000])
 
 
         # Verify that node1 has 2001 keys
         debug("Checking data on node1...")
-        self.check_rows_on_node(node1, 2001, found=[1000])
+        self.check_rows_on_node(checker, node1, 2001, found=[1000])
 
         # Verify that node2 has 2001 keys
         debug("Checking data on node2...")
-        self.check_rows_on_node(node2, 2001, found=[1000])
+        self.check_rows_on_node(checker, node2, 2001, found=[1000])
 
         time.sleep(10) # see CASSANDRA-4373
         # Run repair
@@ -102,5 +107,6 @@ class TestRepair(Tester):
             valid.remove((m.group(2), m.group(1)))
 
         # Check node3 now has the key
-        self.check_rows_on_node(node3, 2001, found=[1000], restart=False)
+        self.check_rows_on_node(checker, node3, 2001, found=[1000])
+        checker.assert_consistent()
 
@@ -0,0 +1,212 @@
+"""
+Comparison of what the replicas of a table hold, without stopping nodes.
+
+Every replica is read directly, token range by token range, through a
+session whitelisted to it. For such a read at CL.ONE to be served by the
+coordinator itself rather than forwarded, the cluster must be started with
+DIRECT_READ_OPTIONS: the rack inferring snitch always sorts the local node
+first, and the dynamic snitch, which could reorder the replicas by latency,
+is turned off. These options apply to the whole cluster, which is then
+no longer running with its default snitch; the checker raises ValueError if
+a node's configuration does not have them. The checker also ALTERs the table
+to turn off read repair and speculative retry, so that reads never touch
+another replica; the table keeps these settings afterwards.
+
+Each (range, replica) is summarized by its row count and a digest of its
+rows while they stream by; only the ranges whose replicas disagree are read
+again to find the rows that differ.
+"""
+import os
+from collections import deque
+
+import yaml
+from cassandra import ConsistencyLevel
+
+from datahelp import row_digest
+from pytools import PagedRows
+
+DIRECT_READ_OPTIONS = {
+    'endpoint_snitch': 'org.apache.cassandra.locator.RackInferringSnitch',
+    'dynamic_snitch': False,
+}
+
+# range reads running at once, over all the replicas
+CONCURRENT_READS = 16
+MAX_REPORTED_ROWS = 10
+MASK = (1 << 64) - 1
+
+
+class ReplicaChecker(object):
+
+    def __init__(self, tester, keyspace, table):
+        self.tester = tester
+        self.keyspace = keyspace
+        self.table = table
+        self.nodes = [node for node in tester.cluster.nodelist() if node.is_running()]
+        self._check_direct_reads()
+        self.sessions = dict((node.name, tester.patient_exclusive_cql_connection(node, keyspace)) for node in self.nodes)
+
+        session = self.sessions[self.nodes[0].name]
+        options = 'read_repair_chance = 0 AND dclocal_read_repair_chance = 0'
+        if tester.cluster.version() >= '2.0':
+            options += " AND speculative_retry = 'NONE'"
+        session.execute("ALTER TABLE %s.%s WITH %s" % (keyspace, table, options))
+        tester.wait_for_schema_agreement(session)
+
+        metadata = session.cluster.metadata
+        table_metadata = metadata.keyspaces[keyspace].tables[table]
+        self.columns = table_metadata.columns.keys()
+        self.primary_key = [column.name for column in table_metadata.primary_key]
+        self.ranges = self._replicated_ranges(metadata)
+
+        select = "SELECT %s FROM %s.%s WHERE " % (', '.join(self.columns), keyspace, table)
+        token = "token(%s)" % ', '.join(column.name for column in table_metadata.partition_key)
+        self.statements = {}
+        for node in self.nodes:
+            session = self.sessions[node.name]
+            statements = {
+                'between': session.prepare(select + "%s > ? AND %s <= ?" % (token, token)),
+                'after': session.prepare(select + "%s > ?" % token),
+                'up_to': session.prepare(select + "%s <= ?" % token),
+            }
+            for statement in statements.values():
+                statement.consistency_level = ConsistencyLevel.ONE
+            self.statements[node.name] = statements
+
+    def _check_direct_reads(self):
+        """
+        Raises ValueError unless every node is configured with
+        DIRECT_READ_OPTIONS, without which a read at ONE may be forwarded.
+        """
+        # cassandra's defaults for the options left out of cassandra.yaml
+        defaults = {'dynamic_snitch': True}
+        for node in self.nodes:
+            with open(os.path.join(node.get_conf_dir(), 'cassandra.yaml')) as f:
+                conf = yaml.safe_load(f)
+            for option, value in DIRECT_READ_OPTIONS.items():
+                actual = conf.get(option, defaults.get(option))
+                if actual != value:
+                    raise ValueError("ReplicaChecker needs the cluster started with DIRECT_READ_OPTIONS, %s has %s: %s" % (
+                        node.name, option, actual))
+
+    def _replicated_ranges(self, metadata):
+        """
+        Returns the (start token, end token, replica names) of the ring.
+        Only SimpleStrategy is supported: the replicas of a range are the
+        owner of its end token and the owners of the next tokens.
+        """
+        strategy = metadata.keyspaces[self.keyspace].replication_strategy
+        replication_factor = getattr(strategy, 'replication_factor', None)
+        if replication_factor is None:
+            raise ValueError("ReplicaChecker only supports SimpleStrategy, %s uses %s" % (self.keyspace, strategy))
+
+        names = dict((self.tester.get_ip_from_node(node), node.name) for node in self.tester.cluster.nodelist())
+        token_map = metadata.token_map
+        ring = token_map.ring
+        owners = [names[token_map.token_to_host_owner[token].address] for token in ring]
+        replication_factor = min(replication_factor, len(set(owners)))
+
+        ranges = []
+        for i, end in enumerate(ring):
+            replicas = []
+            j = i
+            while len(replicas) < replication_factor:
+                if owners[j] not in replicas:
+                    replicas.append(owners[j])
+                j = (j + 1) % len(ring)
+            ranges.append((ring[i - 1].value, end.value, replicas))
+        return ranges
+
+    def _range_reads(self, index, node_name):
+        # a range that wraps around the ring is read in two parts
+        start, end, replicas = self.ranges[index]
+        statements = self.statements[node_name]
+        if index > 0:
+            return [(statements['between'], (start, end))]
+        return [(statements['after'], (start,)), (statements['up_to'], (end,))]
+
+    def _read(self, reads):
+        """
+        Runs reads, a sequence of (tag, node name) of ranges to read, and
+        yields (tag, node name, rows as dicts), with CONCURRENT_READS of them
+        fetching at any time. The rows of each must be consumed before the next.
+        """
+        reads = iter(reads)
+        pending = deque()
+
+        def start_next():
+            for index, node_name in reads:
+                session = self.sessions[node_name]
+                parts = [PagedRows(session, statement, parameters) for statement, parameters in self._range_reads(index, node_name)]
+                pending.append((index, node_name, parts))
+                return
+
+        for i in xrange(CONCURRENT_READS):
+            start_next()
+        while pending:
+            index, node_name, parts = pending.popleft()
+            yield index, node_name, (self._as_dict(row) for rows in parts for row in rows)
+            start_next()
+
+    def _as_dict(self, row):
+        if isinstance(row, dict):
+            return row
+        return dict(zip(self.columns, row))
+
+    def _reads_of(self, indexes, node_names=None):
+        for index in indexes:
+            for node_name in self.ranges[index][2]:
+                if node_names is None or node_name in node_names:
+                    if node_name in self.sessions:
+                        yield index, node_name
+
+    def digests(self, node_names=None):
+        """
+        Returns {range index: {node name: (row count, digest)}} for the
+        replicas of each range, or only for those in node_names.
+        """
+        digests = {}
+        for index, node_name, rows in self._read(self._reads_of(xrange(len(self.ranges)), node_names)):
+            count = 0
+            digest = 0
+            for row in rows:
+                count += 1
+                digest = (digest + row_digest(row)) & MASK
+            digests.setdefault(index, {})[node_name] = (count, digest)
+        return digests
+
+    def count(self, node):
+        """Returns the number of rows node holds for the ranges it replicates"""
+        return sum(summary[node.name][0] for summary in self.digests([node.name]).values())
+
+    def differences(self):
+        """
+        Returns {primary key: {node name: row dict or None}} for the rows
+        that the replicas of their range do not all hold identically. Only
+        the ranges whose digests differ are read again.
+        """
+        mismatched = [index for index, summaries in sorted(self.digests().items())
+                      if len(set(summaries.values())) > 1]
+        rows_by_range = {}
+        for index, node_name, rows in self._read(self._reads_of(mismatched)):
+            replicas = rows_by_range.setdefault(index, {})
+            replicas[node_name] = dict((tuple(row[column] for column in self.primary_key), row) for row in rows)
+
+        differences = {}
+        for replicas in rows_by_range.values():
+            keys = set()
+            for rows in replicas.values():
+                keys.update(rows)
+            for key in keys:
+                versions = dict((node_name, rows.get(key)) for node_name, rows in replicas.items())
+                if any(version != versions.values()[0] for version in versions.values()):
+                    differences[key] = versions
+        return differences
+
+    def assert_consistent(self):
+        differences = self.differences()
+        if differences:
+            reported = sorted(differences.items())[:MAX_REPORTED_ROWS]
+            raise AssertionError("%d rows differ between replicas of %s.%s, including:\n%s" % (
+                len(differences), self.keyspace, self.table,
+                '\n'.join("    %s: %s" % (key, versions) for key, versions in reported)))
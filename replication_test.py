@@ -159,8 +159,8 @@ class ReplicationTest(Tester):
     @no_vnodes()
     def simple_test(self):
         """Test the SimpleStrategy on a 3 node cluster"""
-        self.cluster.populate(3).start()
-        time.sleep(5)
+        self.cluster.populate(3)
+        self.start_cluster(wait_for='gossip')
         node1 = self.cluster.nodelist()[0]
         self.conn = self.patient_exclusive_cql_connection(node1)
 
@@ -197,8 +197,8 @@ class ReplicationTest(Tester):
     @no_vnodes()
     def network_topology_test(self):
         """Test the NetworkTopologyStrategy on a 2DC 3:3 node cluster"""
-        self.cluster.populate([3,3]).start()
-        time.sleep(5)
+        self.cluster.populate([3,3])
+        self.start_cluster(wait_for='gossip')
         node1 = self.cluster.nodelist()[0]
         ip_nodes = dict((node.address(), node) for node in self.cluster.nodelist())
         self.conn = self.patient_exclusive_cql_connection(node1)
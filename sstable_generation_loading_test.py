@@ -2,7 +2,7 @@ import time, os
 from distutils import dir_util
 import subprocess
 
-from dtest import Tester, debug
+from dtest import Tester, debug, wait_until, all_nodes_up, no_pending_compactions
 from ccmlib import common as ccmcommon
 
 class TestSSTableGenerationAndLoading(Tester):
@@ -80,9 +80,8 @@ class TestSSTableGenerationAndLoading(Tester):
         os.system('rm %s/*Statistics.db' % path)
         os.system('rm %s/*Digest.sha1' % path)
 
-        node1.start()
-
-        time.sleep(10)
+        node1.start(wait_for_binary_proto=True)
+        wait_until(no_pending_compactions(node1))
 
         data_found = 0
         for fname in os.listdir(path):
@@ -170,7 +169,7 @@ class TestSSTableGenerationAndLoading(Tester):
         # wipe out the node data.
         cluster.clear()
         cluster.start()
-        time.sleep(5) # let gossip figure out what is going on
+        wait_until(all_nodes_up(cluster.nodelist()))
 
         debug("re-creating the keyspace and column families.")
         cursor = self.cql_connection(node1)
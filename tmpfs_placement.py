@@ -0,0 +1,173 @@
+"""
+Placement of node data and commitlog directories on tmpfs.
+
+Nodes are populated on disk as usual; the directories that take the
+commitlog fsyncs and memtable flushes are then moved to tmpfs and replaced
+by symlinks, so the paths ccm wrote into cassandra.yaml stay valid. A node is
+only placed in RAM if its expected footprint, taken from previous runs of
+the same test, fits in what is left of tmpfs and of the available memory;
+otherwise it stays on disk.
+"""
+import glob
+import json
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where worker processes do not lock each other out
+    fcntl = None
+
+NODE_SUBDIRS = ('data', 'commitlogs')
+
+
+def available_memory():
+    """Returns MemAvailable in bytes, or None where /proc/meminfo does not provide it"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return None
+
+
+def directory_size(path):
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                # removed by a compaction in the meantime
+                pass
+    return total
+
+
+class FootprintHistory(object):
+    """
+    Per test history, shared by all workers through a locked JSON file, of
+    the largest per-node footprint seen and of the average duration of the
+    runs on disk and in RAM.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def estimate(self, test_id, default):
+        return self._load().get(test_id, {}).get('footprint', default)
+
+    def record(self, test_id, footprint, duration, in_ram):
+        """Records a run and returns the updated entry of test_id"""
+        with open(self.path + '.lock', 'w') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                history = self._load()
+                entry = history.setdefault(test_id, {})
+                entry['footprint'] = max(entry.get('footprint', 0), footprint)
+                placement = 'ram' if in_ram else 'disk'
+                runs = entry.get(placement + '_runs', 0)
+                average = entry.get(placement + '_duration', 0.0)
+                entry[placement + '_runs'] = runs + 1
+                entry[placement + '_duration'] = (average * runs + duration) / (runs + 1)
+                partial = self.path + '.partial'
+                with open(partial, 'w') as f:
+                    json.dump(history, f, indent=1, sort_keys=True)
+                os.rename(partial, self.path)
+                return entry
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class TmpfsPlacement(object):
+    """
+    Decides, node by node, whether a cluster's data and commitlog directories
+    go to tmpfs under root. reserve bytes of tmpfs and of available memory
+    are always left free.
+    """
+
+    def __init__(self, root, reserve, history):
+        self.root = root
+        self.reserve = reserve
+        self.history = history
+        # bytes promised to the clusters of this process that are still alive,
+        # updated by the test thread and by the reaper thread
+        self.committed = {}
+        self.lock = threading.Lock()
+
+    def root_for(self, test_path):
+        return os.path.join(self.root, os.path.basename(test_path))
+
+    def capacity(self):
+        with self.lock:
+            return self._capacity()
+
+    def _capacity(self):
+        stat = os.statvfs(self.root)
+        free = stat.f_bavail * stat.f_frsize
+        memory = available_memory()
+        if memory is not None:
+            free = min(free, memory)
+        return free - self.reserve - sum(self.committed.values())
+
+    def place(self, test_id, test_path, nodes, default_footprint):
+        """Moves what fits of nodes to tmpfs and returns the placed nodes"""
+        if not os.path.isdir(self.root):
+            return []
+        footprint = self.history.estimate(test_id, default_footprint)
+        placed = []
+        for node in nodes:
+            with self.lock:
+                if self._capacity() < footprint:
+                    break
+                self.committed[test_path] = self.committed.get(test_path, 0) + footprint
+            target = os.path.join(self.root_for(test_path), node.name)
+            if not os.path.isdir(target):
+                os.makedirs(target)
+            for subdir in NODE_SUBDIRS:
+                source = os.path.join(node.get_path(), subdir)
+                destination = os.path.join(target, subdir)
+                if os.path.islink(source):
+                    continue
+                if os.path.exists(source):
+                    shutil.move(source, destination)
+                else:
+                    os.mkdir(destination)
+                os.symlink(destination, source)
+            placed.append(node)
+        return placed
+
+    def release(self, test_path):
+        """
+        Frees the tmpfs space of the stopped cluster at test_path. If the
+        cluster directory is still there (KEEP_TEST_DIR, or its removal
+        failed), the directories on tmpfs are first moved back in place of
+        their symlinks.
+        """
+        root = self.root_for(test_path)
+        try:
+            if os.path.isdir(root) and os.path.isdir(test_path):
+                for node_name in os.listdir(root):
+                    for subdir in NODE_SUBDIRS:
+                        destination = os.path.join(root, node_name, subdir)
+                        # test_path/<cluster name>/<node name>/<subdir>
+                        for link in glob.glob(os.path.join(test_path, '*', node_name, subdir)):
+                            if os.path.islink(link) and os.readlink(link) == destination:
+                                os.unlink(link)
+                                shutil.move(destination, link)
+        finally:
+            with self.lock:
+                self.committed.pop(test_path, None)
+            shutil.rmtree(root, ignore_errors=True)
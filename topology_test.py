@@ -1,4 +1,4 @@
-from dtest import Tester
+from dtest import Tester, wait_until, no_pending_compactions, streams_finished
 from pytools import insert_c1c2, query_c1c2, no_vnodes, new_node
 from pyassertions import assert_almost_equal
 
@@ -72,7 +72,7 @@ class TestTopology(Tester):
         node4.decommission()
         node4.stop()
         cluster.cleanup()
-        time.sleep(.5)
+        wait_until(no_pending_compactions(cluster.nodelist()))
 
         # Check we can get all the keys
         for n in xrange(0, 10000):
@@ -87,9 +87,9 @@ class TestTopology(Tester):
         if cluster.version() <= '1.2':
             node3.stop(wait_other_notice=True)
             node1.removeToken(tokens[2])
-            time.sleep(.5)
+            wait_until(streams_finished(cluster.nodelist()))
             cluster.cleanup()
-            time.sleep(.5)
+            wait_until(no_pending_compactions(cluster.nodelist()))
 
             # Check we can get all the keys
             for n in xrange(0, 10000):
@@ -99,12 +99,14 @@ class TestTopology(Tester):
             assert_almost_equal(*sizes)
             assert_almost_equal(sizes[0], 2 * init_size)
 
-            node5 = new_node(cluster, token=(tokens[2]+1)).start()
-            time.sleep(.5)
+            node5 = new_node(cluster, token=(tokens[2]+1))
+            node5.start(wait_other_notice=True)
+            # thrift only starts listening once the bootstrap is over
+            node5.watch_log_for("Listening for thrift clients...")
+            wait_until(streams_finished(cluster.nodelist()))
             cluster.cleanup()
-            time.sleep(.5)
             cluster.compact()
-            time.sleep(.5)
+            wait_until(no_pending_compactions(cluster.nodelist()))
 
             # Check we can get all the keys
             for n in xrange(0, 10000):
@@ -1,18 +1,18 @@
 import bisect
 import os
-import random
 import re
 import subprocess
 import time
-import uuid
+import zlib
 
 from collections import defaultdict
 from distutils.version import LooseVersion
 from dtest import Tester, debug, DISABLE_VNODES, DEFAULT_DIR
 from pytools import new_node
+from data_generator import DataGenerator
 from ccmlib import common as ccmcommon
 import tarfile
-from cassandra import ConsistencyLevel, WriteTimeout
+from cassandra import ConsistencyLevel, WriteTimeout, ReadTimeout
 from cassandra.query import SimpleStatement
 
 TRUNK_VER = '2.2'
@@ -144,8 +144,13 @@ class TestUpgradeThroughVersions(Tester):
         self.upgrade_scenario(mixed_version=True)
 
     def upgrade_scenario(self, populate=True, create_schema=True, mixed_version=False, after_upgrade_call=()):
-        # Record the rows we write as we go:
-        self.row_values = set()
+        # The values written are a function of their index, so only how
+        # many have been written is recorded as we go:
+        self.data = DataGenerator(seed=zlib.crc32(self.id()), table='cf')
+        self.rows_written = 0
+        self.counter_round = 0
+        self.counter_ops = 0
+        self.counter_timeouts = defaultdict(int)
         cluster = self.cluster
 
         if populate:
@@ -280,21 +285,20 @@ class TestUpgradeThroughVersions(Tester):
     def _write_values(self, num=100):
         cursor = self.patient_cql_connection(self.node2, protocol_version=1)
         cursor.execute("use upgrade")
-        for i in xrange(num):
-            x = len(self.row_values) + 1
-            cursor.execute("UPDATE cf SET v='%d' WHERE k=%d" % (x, x))
-            self.row_values.add(x)
+        for x in xrange(self.rows_written + 1, self.rows_written + num + 1):
+            cursor.execute("UPDATE cf SET v='%s' WHERE k=%d" % (self.data.text(x, 'v'), x))
+            self.rows_written = x
 
     def _check_values(self, consistency_level=ConsistencyLevel.ALL):
         for node in self.cluster.nodelist():
             cursor = self.patient_cql_connection(node, protocol_version=1)
             cursor.execute("use upgrade")
-            for x in self.row_values:
+            for x in xrange(1, self.rows_written + 1):
                 query = SimpleStatement("SELECT k,v FROM cf WHERE k=%d" % x, consistency_level=consistency_level)
                 result = cursor.execute(query)
                 k,v = result[0]
                 self.assertEqual(x, k)
-                self.assertEqual(str(x), v)
+                self.assertEqual(self.data.text(x, 'v'), v)
 
     def _increment_counters(self, opcount=25000):
         debug("performing {opcount} counter increments".format(opcount=opcount))
@@ -303,47 +307,70 @@ class TestUpgradeThroughVersions(Tester):
 
         update_counter_query = ("UPDATE countertable SET c = c + 1 WHERE k1='{key1}' and k2={key2}")
 
-        self.expected_counts = {}
-        for i in range(10):
-            self.expected_counts[uuid.uuid4()] = defaultdict(int)
-
+        # every round increments a new set of counters
+        self.counter_round += 1
+        self.counter_ops = 0
+        self.counter_timeouts = defaultdict(int)
         fail_count = 0
 
         for i in range(opcount):
-            key1 = random.choice(self.expected_counts.keys())
-            key2 = random.randint(1, 10)
+            key1, key2 = self._counter_key(i)
             try:
                 query = SimpleStatement(update_counter_query.format(key1=key1, key2=key2), consistency_level=ConsistencyLevel.ALL)
                 cursor.execute(query)
             except WriteTimeout:
                 fail_count += 1
-            else:
-                self.expected_counts[key1][key2] += 1
+                self.counter_timeouts[i % self.COUNTERS] += 1
+            self.counter_ops = i + 1
             if fail_count > 100:
                 break
 
         assert fail_count < 100, "Too many counter increment failures"
 
+    COUNTERS = 100
+
+    def _counter_key(self, op):
+        """
+        Returns the (k1, k2) of the counter that the op-th increment of the
+        current round goes to, cycling through COUNTERS counters.
+        """
+        counter = op % self.COUNTERS
+        return self.data.uuid(counter // 10, 'k1', version=self.counter_round), counter % 10 + 1
+
     def _check_counters(self):
         debug("Checking counter values...")
         cursor = self.patient_cql_connection(self.node2, version="3.0.0", protocol_version=1)
         cursor.execute("use upgrade;")
 
-        for key1 in self.expected_counts.keys():
-            for key2 in self.expected_counts[key1].keys():
-                expected_value = self.expected_counts[key1][key2]
+        for counter in xrange(min(self.counter_ops, self.COUNTERS)):
+            key1, key2 = self._counter_key(counter)
+            increments = self.counter_ops // self.COUNTERS + (1 if counter < self.counter_ops % self.COUNTERS else 0)
+            expected_value = increments - self.counter_timeouts[counter]
 
-                query = SimpleStatement("SELECT c from countertable where k1='{key1}' and k2={key2};".format(key1=key1, key2=key2),
-                    consistency_level=ConsistencyLevel.ONE)
-                results = cursor.execute(query)
+            query = SimpleStatement("SELECT c from countertable where k1='{key1}' and k2={key2};".format(key1=key1, key2=key2),
+                consistency_level=ConsistencyLevel.ONE)
+            results = self._read_counter(cursor, query)
 
-                if results is not None:
-                    actual_value = results[0][0]
-                else:
-                    # counter wasn't found
-                    actual_value = None
+            if results:
+                actual_value = results[0][0]
+            else:
+                # counter wasn't found
+                actual_value = 0
+
+            assert actual_value == expected_value, "Counter not at expected value. Got %s, expected %s" % (actual_value, expected_value)
 
-                assert actual_value == expected_value, "Counter not at expected value. Got %s, expected %s" % (actual_value, expected_value)
+    def _read_counter(self, cursor, query, attempts=5):
+        """
+        Runs query, retrying it when the read times out: reads are
+        idempotent, so this does not change the value that is checked.
+        """
+        for attempt in xrange(1, attempts + 1):
+            try:
+                return cursor.execute(query)
+            except ReadTimeout:
+                if attempt == attempts:
+                    raise
+                debug("Counter read timed out, retrying")
 
 
 class TestRandomPartitionerUpgrade(TestUpgradeThroughVersions):
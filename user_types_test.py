@@ -68,8 +68,7 @@ class TestUserTypes(Tester):
               )
            """
         cursor.execute(stmt)
-        # Make sure the scheam propagate
-        time.sleep(2)
+        self.wait_for_schema_agreement(cursor)
 
         _id = uuid.uuid4()
         stmt = """
@@ -189,8 +188,7 @@ class TestUserTypes(Tester):
               )
            """
         cursor.execute(stmt)
-        # Make sure the scheam propagate
-        time.sleep(2)
+        self.wait_for_schema_agreement(cursor)
 
         # here we will attempt an insert statement which should fail
         # because the user type is an int, but the insert statement is
@@ -253,8 +251,7 @@ class TestUserTypes(Tester):
               )
            """
         cursor.execute(stmt)
-        # Make sure the scheam propagate
-        time.sleep(2)
+        self.wait_for_schema_agreement(cursor)
 
         #  Insert some data:
         _id = uuid.uuid4()
@@ -347,8 +344,7 @@ class TestUserTypes(Tester):
               )
            """
         cursor.execute(stmt)
-        # Make sure the scheam propagate
-        time.sleep(2)
+        self.wait_for_schema_agreement(cursor)
 
         _id = uuid.uuid4()
 
@@ -406,8 +402,7 @@ class TestUserTypes(Tester):
               )
            """
         cursor.execute(stmt)
-        # Make sure the scheam propagate
-        time.sleep(2)
+        self.wait_for_schema_agreement(cursor)
 
         # no index present yet, make sure there's an error trying to query column
         stmt = """
@@ -601,8 +596,7 @@ class TestUserTypes(Tester):
               )
            """
         cursor.execute(stmt)
-        # Make sure the schema propagates
-        time.sleep(2)
+        self.wait_for_schema_agreement(cursor)
 
         # Adds an explicit null
         cursor.execute("INSERT INTO bucket (id, my_item) VALUES (0, {sub_one: 'test', sub_two: null})")
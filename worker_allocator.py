@@ -0,0 +1,116 @@
+"""
+Partitions per-host resources between dtest processes running side by side.
+
+Each nose worker gets its own block of loopback addresses (127.0.N.x), its own
+JMX and remote debug port range and its own cluster journal, so that
+several ccm clusters can run on the same machine without colliding. The
+process that is not a worker (index 0) keeps the historical 127.0.0.x
+addresses and ports so single-process runs are unchanged.
+
+On Linux the whole 127.0.0.0/8 block is routed to lo; on other platforms
+the 127.0.N.x aliases have to be created before running with workers.
+"""
+import multiprocessing
+import os
+
+MAX_WORKERS = 254
+# Worker ports stay below 32768, where the ephemeral range starts on Linux,
+# so that an outgoing connection can never take a node's port. The two
+# ranges do not overlap and keep clear of the fixed cassandra ports
+# (7000-7199, 9042, 9160) and of the ports used by index 0.
+PORTS_PER_WORKER = 20
+WORKER_JMX_BASE_PORT = 10000
+WORKER_DEBUG_BASE_PORT = 16000
+EPHEMERAL_PORT_START = 32768
+assert WORKER_JMX_BASE_PORT + (MAX_WORKERS + 1) * PORTS_PER_WORKER <= WORKER_DEBUG_BASE_PORT
+assert WORKER_DEBUG_BASE_PORT + (MAX_WORKERS + 1) * PORTS_PER_WORKER <= EPHEMERAL_PORT_START
+JOURNAL = 'dtest_journal'
+
+
+def worker_index():
+    """
+    Returns the index of the current worker process, 0 when not running as
+    a nose multiprocess worker. DTEST_WORKER overrides the detection.
+    """
+    override = os.environ.get('DTEST_WORKER')
+    if override:
+        return int(override)
+    # nose's multiprocess plugin runs its workers as multiprocessing children,
+    # which are numbered from 1
+    identity = multiprocessing.current_process()._identity
+    if identity:
+        return identity[0]
+    return 0
+
+
+class WorkerAllocation(object):
+    """
+    The addresses, ports and bookkeeping file reserved for one worker.
+    """
+
+    def __init__(self, index):
+        if not 0 <= index <= MAX_WORKERS:
+            raise ValueError("worker index must be between 0 and %d, got %d" % (MAX_WORKERS, index))
+        self.index = index
+        self.pid = os.getpid()
+
+    @property
+    def ipprefix(self):
+        return '127.0.%d.' % self.index
+
+    @property
+    def journal_path(self):
+        if self.index == 0:
+            return JOURNAL
+        return '%s.%d' % (JOURNAL, self.index)
+
+    def address(self, node_number):
+        return self.ipprefix + str(node_number)
+
+    def _worker_port(self, base, node_number):
+        if not 0 < node_number < PORTS_PER_WORKER:
+            raise ValueError("a worker has ports for nodes 1 to %d, got node %d" % (PORTS_PER_WORKER - 1, node_number))
+        return str(base + self.index * PORTS_PER_WORKER + node_number)
+
+    def jmx_port(self, node_number):
+        if self.index == 0:
+            return str(7000 + node_number * 100)
+        return self._worker_port(WORKER_JMX_BASE_PORT, node_number)
+
+    def remote_debug_port(self, node_number):
+        if self.index == 0:
+            return str(2000 + node_number)
+        return self._worker_port(WORKER_DEBUG_BASE_PORT, node_number)
+
+    def assign_ports(self, cluster):
+        """
+        Moves the JMX port, and the remote debug port of nodes populated with
+        debug, of every node of a populated cluster into this worker's range.
+        Both listen on all interfaces, so unlike the thrift, native and
+        storage ports they cannot be separated by address alone.
+        """
+        if self.index == 0:
+            return
+        for number, node in enumerate(cluster.nodelist(), 1):
+            jmx_port = self.jmx_port(number)
+            # ccm uses '0' for a node without remote debugging
+            debug_port = self.remote_debug_port(number) if str(node.remote_debug_port) != '0' else node.remote_debug_port
+            if node.jmx_port != jmx_port or node.remote_debug_port != debug_port:
+                node.jmx_port = jmx_port
+                node.remote_debug_port = debug_port
+                node.import_config_files()
+                node._update_config()
+
+
+_allocation = None
+
+
+def current_allocation():
+    """
+    Returns the allocation of the calling process. It is computed lazily as
+    workers are forked after the test modules have been imported.
+    """
+    global _allocation
+    if _allocation is None or _allocation.pid != os.getpid():
+        _allocation = WorkerAllocation(worker_index())
+    return _allocation